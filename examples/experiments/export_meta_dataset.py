@@ -0,0 +1,34 @@
+import argparse
+import json
+import openml
+import openmlpimp
+import os
+
+
+# creates meta-datasets like <openml_pimp_root>/KDD2018/data/arff/adaboost.arff
+def read_cmd():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flow_id', default=6970, type=int)
+    parser.add_argument('--classifier', default='adaboost', type=str)
+    parser.add_argument('--study_id', default='OpenML100', type=str)
+    parser.add_argument('--fixed_parameters', type=json.loads, default=None)
+    parser.add_argument('--measure', default='predictive_accuracy', type=str)
+    parser.add_argument('--num_runs', default=None, type=int, help='Max runs per task')
+    parser.add_argument('--n_workers', default=8, type=int, help='Number of tasks obtained concurrently')
+    parser.add_argument('--output_file', default=os.path.expanduser('~/experiments/openml-pimp/meta_dataset.arff'), type=str)
+    args_, misc = parser.parse_known_args()
+
+    return args_
+
+
+if __name__ == '__main__':
+    args = read_cmd()
+    study = openml.study.get_study(args.study_id, 'tasks')
+    config_space = openmlpimp.utils.get_config_space_casualnames(args.classifier, args.fixed_parameters)
+
+    num_rows = openmlpimp.utils.export_meta_dataset(args.output_file, args.flow_id, study.tasks, config_space,
+                                                    measure=args.measure,
+                                                    study_id=args.study_id,
+                                                    num_runs=args.num_runs,
+                                                    n_workers=args.n_workers)
+    print('%s Added %d rows to %s' % (openmlpimp.utils.get_time(), num_rows, args.output_file))
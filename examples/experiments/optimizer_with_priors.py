@@ -38,6 +38,10 @@ def parse_args():
     parser.add_argument('--num_brackets', type=int, default=None, help='hyperband parameter')
     parser.add_argument('--num_iterations', type=int, default=50, help='random search parameter')
     parser.add_argument('--n_jobs', type=int, default=-1, help='parallelize')
+    parser.add_argument('--prefetch_depth', type=int, default=2, help='number of tasks that are loaded in the background')
+    parser.add_argument('--cache_quota', type=int, default=None, help='Disk quota (bytes) of the kde cache')
+    parser.add_argument('--response_cache', type=str, default=None, help='Directory to cache OpenML responses in')
+    parser.add_argument('--metrics_report', type=str, default=None, help='Json file to write OpenML call metrics to at exit')
 
     args = parser.parse_args()
 
@@ -66,6 +70,10 @@ if __name__ == '__main__':
     args = parse_args()
     if args.openml_server:
         openml.config.server = args.openml_server
+    if args.response_cache:
+        openmlpimp.utils.set_response_cache(args.response_cache)
+    if args.metrics_report:
+        openmlpimp.utils.enable_metrics_report(args.metrics_report)
 
     if args.flow_id == 6969:
         classifier = 'random_forest'
@@ -103,6 +111,7 @@ if __name__ == '__main__':
     output_save_folder_suffix = openmlpimp.utils.fixed_parameters_to_suffix(optimizer_parameters)
     cache_save_folder_suffix = openmlpimp.utils.fixed_parameters_to_suffix(args.fixed_parameters)
     cache_dir = args.cache_dir + '/' + str(args.flow_id) + '/' + cache_save_folder_suffix
+    manifest = openmlpimp.utils.ArtifactManifest(args.cache_dir + '/manifest.json', quota_bytes=args.cache_quota)
 
     configuration_space = openmlpimp.utils.get_config_space_casualnames(classifier, args.fixed_parameters)
     hyperparameters = dict(configuration_space._hyperparameters.items())
@@ -120,17 +129,17 @@ if __name__ == '__main__':
     else:
         raise ValueError()
 
-    for task_id in all_task_ids:
-        task = openml.tasks.get_task(task_id)
-        data_name = task.get_dataset().name
-        data_qualities = task.get_dataset().qualities
+    for prefetched in openmlpimp.utils.TaskPrefetcher(all_task_ids, depth=args.prefetch_depth):
+        task_id, task, dataset = prefetched
+        data_name = dataset.name
+        data_qualities = dataset.qualities
         print("%s Obtained task %d (%s); %s attributes; %s observations" % (openmlpimp.utils.get_time(), task_id,
                                                                             data_name,
                                                                             data_qualities['NumberOfFeatures'],
                                                                             data_qualities['NumberOfInstances']))
 
         for seed in seeds:
-            indices = task.get_dataset().get_features_by_type('nominal', [task.target_name])
+            indices = dataset.get_features_by_type('nominal', [task.target_name])
             base, required_params = openmlpimp.utils.modeltype_to_classifier(classifier, {'random_state': 1})
             pipe = openmlpimp.utils.classifier_to_pipeline(base, indices)
             if required_params is not None:
@@ -168,7 +177,8 @@ if __name__ == '__main__':
                                                                              args.fixed_parameters,
                                                                              holdout=holdout,
                                                                              bestN=args.bestN,
-                                                                             oob_strategy=args.oob_strategy)
+                                                                             oob_strategy=args.oob_strategy,
+                                                                             manifest=manifest)
                     param_distributions = update_param_dist(classifier, param_distributions)
                     print('%s Param Grid:' % openmlpimp.utils.get_time(), param_distributions)
 
@@ -249,7 +259,7 @@ if __name__ == '__main__':
                 run = openmlpimp.utils.do_run(task, optimizer, output_dir, False)
                 score = run.get_metric_fn(sklearn.metrics.accuracy_score)
 
-                print('%s [SCORE] Data: %s; Accuracy: %0.2f' % (openmlpimp.utils.get_time(), task.get_dataset().name, score.mean()))
+                print('%s [SCORE] Data: %s; Accuracy: %0.2f' % (openmlpimp.utils.get_time(), data_name, score.mean()))
 
                 executions_done += 1
                 if args.n_executions is not None:
@@ -25,6 +25,7 @@ def parse_args():
     parser.add_argument('--random_order', action="store_true", help='Iterates the tasks in a random order')
     parser.add_argument('--task_ids', type=int, nargs="+", default=None, help='the openml task ids to execute')
     parser.add_argument('--optimizer', type=str, default='random_search')
+    parser.add_argument('--prefetch_depth', type=int, default=2, help='number of tasks that are loaded in the background')
 
     args = parser.parse_args()
     return args
@@ -50,9 +51,9 @@ if __name__ == '__main__':
     cache_save_folder_suffix = openmlpimp.utils.fixed_parameters_to_suffix(args.fixed_parameters)
 
     print('Tasks:', task_ids)
-    for task_id in task_ids:
-        task = openml.tasks.get_task(task_id)
-        indices = task.get_dataset().get_features_by_type('nominal', [task.target_name])
+    for prefetched in openmlpimp.utils.TaskPrefetcher(task_ids, depth=args.prefetch_depth):
+        task_id, task, dataset = prefetched
+        indices = dataset.get_features_by_type('nominal', [task.target_name])
 
         preset_params = {'random_state': 1}
         if args.fixed_parameters:
@@ -1,14 +1,10 @@
 import arff
 import argparse
-import fanova
-from fanova.visualizer import Visualizer
-import itertools
 import json
-import numpy as np
 import logging
 import openmlcontrib
+import openmlpimp.backend.meta_fanova
 import os
-import pandas as pd
 import sklearnbot
 
 # to plot: <openml_pimp_root>/examples/plot/plot_fanova.py
@@ -18,9 +14,24 @@ def read_cmd():
     parser.add_argument('--output_directory', default=os.path.expanduser('~/experiments/openml-pimp'), type=str)
     parser.add_argument('--classifier', default='adaboost', type=str)
     parser.add_argument('--measure', default='predictive_accuracy', type=str)
-    parser.add_argument('--comb_size', default=2, type=int)
-    parser.add_argument('--n_trees', default=16, type=int)
+    parser.add_argument('--comb_size', default=2, type=int, help='Max interaction order')
+    parser.add_argument('--interaction_threshold', default=None, type=float,
+                        help='Only expand subsets of which all lower order subsets have at least this importance')
+    parser.add_argument('--beam_width', default=None, type=int, help='Max number of subsets per order to expand')
+    parser.add_argument('--n_trees', default=16, type=int, help='Number of trees (max number in adaptive mode)')
+    parser.add_argument('--quantization_levels', default=None, type=int,
+                        help='Bin numeric hyperparameters into this many levels and aggregate duplicate runs')
+    parser.add_argument('--adaptive_tolerance', default=None, type=float,
+                        help='Grow trees and runs until the importances change less than this')
     parser.add_argument('--resolution', default=100, type=int)
+    parser.add_argument('--seed', default=None, type=int)
+    parser.add_argument('--n_jobs', default=1, type=int, help='Tasks to run in parallel (-1: all cores)')
+    parser.add_argument('--variance_cache', default=None, type=str, help='Directory to cache fANOVA variance tables in')
+    parser.add_argument('--joint_model', action='store_true', default=False,
+                        help='Train one model on all tasks, with the task meta-features as inputs')
+    parser.add_argument('--task_qualities', default='../../KDD2018/data/fanova/task_qualities.json', type=str)
+    parser.add_argument('--qualities', default=None, type=lambda value: value.split(','),
+                        help='Comma separated meta-features for the joint model')
     args_, misc = parser.parse_known_args()
 
     return args_
@@ -45,58 +56,40 @@ def run(args):
     data = openmlcontrib.meta.arff_to_dataframe(arff_dataset, config_space)
     data = openmlcontrib.meta.integer_encode_dataframe(data, config_space)
     meta_data = get_dataset_metadata(args.dataset_path)
-    if args.measure not in data.columns.values:
-        raise ValueError('Could not find measure in dataset: %s' % args.measure)
     if set(config_space.get_hyperparameter_names()) != set(meta_data['col_parameters']):
         missing_cs = set(meta_data['col_parameters']) - set(config_space.get_hyperparameter_names())
         missing_ds = set(config_space.get_hyperparameter_names()) - set(meta_data['col_parameters'])
         raise ValueError('ConfigSpace and hyperparameters of dataset do not '
                          'align. ConfigSpace misses: %s, dataset misses: %s' % (missing_cs, missing_ds))
-    task_ids = data['task_id'].unique()
 
-    result = list()
-    for idx, task_id in enumerate(task_ids):
-        logging.info('Running fanova on task %d (%d/%d)' % (task_id, idx + 1, len(task_ids)))
-        data_task = data[data['task_id'] == task_id]
-        
-        evaluator = fanova.fanova.fANOVA(X=data_task[config_space.get_hyperparameter_names()].values,
-                                         Y=data_task[args.measure].values,
-                                         config_space=config_space,
-                                         n_trees=args.n_trees)
+    if args.joint_model:
+        with open(args.task_qualities) as fp:
+            task_qualities = {int(task_id): qualities for task_id, qualities in json.load(fp).items()}
+        result_path = os.path.join(args.output_directory, 'fanova_%s_joint.csv' % args.classifier)
+        global_importance = openmlpimp.backend.meta_fanova.run_joint_meta_dataset(
+            data, config_space, args.measure, task_qualities, result_path,
+            qualities=args.qualities,
+            n_trees=args.n_trees,
+            comb_size=args.comb_size,
+            seed=args.seed,
+            variance_cache=args.variance_cache,
+            n_jobs=None if args.n_jobs == -1 else args.n_jobs)
+        logging.info('global importance: %s' % global_importance)
+        logging.info('resulting csv: %s' % result_path)
+        return
 
-        os.makedirs(args.output_directory, exist_ok=True)
-
-        vis = Visualizer(evaluator, config_space, args.output_directory, y_label='Predictive Accuracy')
-        indices = list(range(len(config_space.get_hyperparameters())))
-        for comb_size in range(1, args.comb_size + 1):
-            for idx in itertools.combinations(indices, comb_size):
-                param_names = np.array(config_space.get_hyperparameter_names())[np.array(idx)]
-                logging.info('-- Calculating marginal for %s' % param_names)
-                importance = evaluator.quantify_importance(idx)[idx]
-                if comb_size == 1:
-                    visualizer_res = vis.generate_marginal(idx[0], args.resolution)
-                    # visualizer returns mean, std and potentially grid
-                    avg_marginal = np.array(visualizer_res[0])
-                elif comb_size == 2:
-                    visualizer_res = vis.generate_pairwise_marginal(idx, args.resolution)
-                    # visualizer returns grid names and values
-                    avg_marginal = np.array(visualizer_res[1])
-                else:
-                    raise ValueError('No support yet for higher dimensions than 2. Got: %d' % comb_size)
-                difference_max_min = max(avg_marginal.reshape((-1,))) - min(avg_marginal.reshape((-1,)))
-
-                current = {
-                    'task_id': task_id,
-                    'hyperparameter': ' / '.join(param_names),
-                    'n_hyperparameters': len(param_names),
-                    'importance_variance': importance['individual importance'],
-                    'importance_max_min': difference_max_min,
-                }
-                
-                result.append(current)
-    df_result = pd.DataFrame(result)
     result_path = os.path.join(args.output_directory, 'fanova_%s_depth_%d.csv' % (args.classifier, args.comb_size))
-    df_result.to_csv(result_path)
+    openmlpimp.backend.meta_fanova.run_on_meta_dataset(data, config_space, args.measure, result_path,
+                                                       n_trees=args.n_trees,
+                                                       comb_size=args.comb_size,
+                                                       resolution=args.resolution,
+                                                       interaction_threshold=args.interaction_threshold,
+                                                       beam_width=args.beam_width,
+                                                       seed=args.seed,
+                                                       variance_cache=args.variance_cache,
+                                                       adaptive_tolerance=args.adaptive_tolerance,
+                                                       quantization_levels=args.quantization_levels,
+                                                       n_jobs=None if args.n_jobs == -1 else args.n_jobs)
     logging.info('resulting csv: %s' % result_path)
     logging.info('To plot, run <openml_pimp_root>/examples/plot/plot_fanova.py')
 
@@ -0,0 +1,42 @@
+import argparse
+import logging
+import openmlpimp.backend.marginals
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+# renders the marginals that run_pimp_across_datasets.py stored (see --lazy_plots)
+def read_cmd():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--result_directory', default=os.path.expanduser('~/experiments/pimp'), type=str)
+    parser.add_argument('--extension', default='pdf', type=str)
+    parser.add_argument('--n_workers', default=4, type=int)
+    parser.add_argument('--force', action='store_true', default=False, help='Also render marginals that have figures already')
+    args_, misc = parser.parse_known_args()
+
+    return args_
+
+
+def run(args):
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+
+    marginal_files = []
+    for directory, _, files in os.walk(args.result_directory):
+        if openmlpimp.backend.marginals.MARGINALS_FILE not in files:
+            continue
+        if not args.force and any(file.endswith('.' + args.extension) for file in files):
+            continue
+        marginal_files.append(os.path.join(directory, openmlpimp.backend.marginals.MARGINALS_FILE))
+    logging.info('Rendering marginals of %d directories' % len(marginal_files))
+
+    with ProcessPoolExecutor(max_workers=args.n_workers) as executor:
+        futures = [executor.submit(openmlpimp.backend.marginals.render_marginals, path, extension=args.extension)
+                   for path in marginal_files]
+        for path, future in zip(marginal_files, futures):
+            logging.info('Rendered %d figures from %s' % (len(future.result()), path))
+
+
+if __name__ == '__main__':
+    run(read_cmd())
@@ -12,6 +12,7 @@ import openml
 from ConfigSpace.read_and_write.pcs_new import read
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
 from openmlpimp.backend.fanova import FanovaBackend
+from openmlpimp.backend.marginals import wait_for_renders
 from openmlpimp.backend.pimp import PimpBackend
 
 cmd_folder = os.path.realpath(os.path.abspath(os.path.split(inspect.getfile(inspect.currentframe()))[0]))
@@ -34,19 +35,86 @@ def read_cmd():
                         help='Will only use configurations that have these parameters fixed')
     parser.add_argument('-Q', '--use_quantiles', action="store_true", default=False,
                         help='Use quantile information instead of full range')
-    parser.add_argument('-T', '--n_trees', type=int, default=128)
+    parser.add_argument('-T', '--n_trees', type=int, default=128, help='Number of trees (max number in adaptive mode)')
+    parser.add_argument('--percentile_cutoffs', type=json.loads, default=None,
+                        help='Also compute importances for these performance ranges (percentiles, e.g. [[0, 100], [75, 100]]), '
+                             'from the same forest')
+    parser.add_argument('--quantization_levels', type=int, default=None,
+                        help='Bin numeric hyperparameters into this many levels and aggregate duplicate runs')
+    parser.add_argument('--n_bootstrap', type=int, default=None,
+                        help='Number of bootstrap samples for confidence intervals of the importances')
+    parser.add_argument('--adaptive_tolerance', type=float, default=None,
+                        help='Grow trees and (stratified) runs until the importances change less than this')
     parser.add_argument('-X', '--draw_plots', action="store_true", default=False,
                         help='Draw plots of the marginals and interactions')
+    parser.add_argument('--lazy_plots', action="store_true", default=False,
+                        help='Only store the marginals; render them with render_fanova_marginals.py')
     parser.add_argument('-I', '--interaction_effect', action="store_true", default=True)
+    parser.add_argument('--max_interaction_order', type=int, default=3)
+    parser.add_argument('--interaction_threshold', type=float, default=None,
+                        help='Only expand interactions of which all lower order subsets have at least this importance')
+    parser.add_argument('--beam_width', type=int, default=None, help='Max number of interactions per order to expand')
+    parser.add_argument('-J', '--n_jobs', type=int, default=1,
+                        help='Processes for computing the (interaction) importances (-1: all cores)')
+    parser.add_argument('--variance_cache', type=str, default=os.path.expanduser('~') + '/experiments/fanova_variance_cache',
+                        help='Directory to store the fANOVA variance tables in, reused for the same runs and '
+                             'seed (empty string to disable)')
     parser.add_argument('-M', '--modus', type=str, choices=['ablation', 'fanova'],
                         default='fanova', help='Whether to use ablation or fanova')
     parser.add_argument('-L', '--limit', type=int, default=None, help='Max runs per task (efficiency)')
+    parser.add_argument('--save_folder', type=str, default=None,
+                        help='Folder for the results (default: new timestamped folder). '
+                             'Tasks that were completed in an existing folder are skipped')
+    parser.add_argument('--runtime_measure', type=str, default=None,
+                        help='OpenML measure to store as runtime in the runhistory (e.g., usercpu_time_millis)')
+    parser.add_argument('--response_cache', type=str, default=None, help='Directory to cache OpenML responses in')
+    parser.add_argument('--response_cache_ttl', type=float, default=7 * 24 * 3600, help='Max age of cached responses (seconds)')
+    parser.add_argument('--response_cache_max_bytes', type=int, default=None,
+                        help='Disk quota (bytes) of the response cache; least recently used responses are evicted')
+    parser.add_argument('--metrics_report', type=str, default=None, help='Json file to write OpenML call metrics to at exit')
+    parser.add_argument('--raw_store', type=str, default=os.path.expanduser('~') + '/experiments/fanova/raw_evaluations',
+                        help='Directory to store the unfiltered evaluations and setups in, shared by all settings '
+                             '(empty string to disable)')
+    parser.add_argument('--cache_quota', type=int, default=None,
+                        help='Disk quota (bytes) of the runhistory cache; least recently used tasks are evicted')
+    parser.add_argument('--fixtures_mode', type=str, choices=['record', 'replay'], default=None,
+                        help='Record OpenML responses to, or replay them from, the fixtures directory')
+    parser.add_argument('--fixtures_dir', type=str, default=os.path.expanduser('~') + '/experiments/openml_fixtures')
+    parser.add_argument('--fixtures_latency', type=float, default=0.0, help='Simulated latency per replayed call (seconds)')
 
     args_, misc = parser.parse_known_args()
 
     return args_
 
 
+# the arguments that determine the results of a run
+RESULT_SETTINGS = ['flow_id', 'model_type', 'openml_studyid', 'required_setups', 'fixed_parameters', 'use_quantiles',
+                   'n_trees', 'interaction_effect', 'modus', 'limit', 'seed', 'max_interaction_order', 'interaction_threshold',
+                   'beam_width', 'adaptive_tolerance', 'n_bootstrap',
+                   'quantization_levels', 'percentile_cutoffs']
+
+
+def load_importances(results_file, param_names):
+    with open(results_file) as result_file:
+        data = json.load(result_file)
+
+    # for pimp backend
+    if 'ablation' in data:
+        data = data['ablation']
+        # remove obsolute fields
+        if '-source-' in data:
+            del data['-source-']
+        if '-target-' in data:
+            del data['-target-']
+        # add missing fields
+        for param in param_names:
+            if param not in data:
+                data[param] = 0.0
+    if 'fanova' in data:
+        data = data['fanova']
+    return data
+
+
 def fixed_parameters_to_ignore_parameters(fixed_parameters):
     ignore_parameters = {'random_state', 'sparse', 'verbose'}
     if fixed_parameters is None:
@@ -64,37 +132,64 @@ if __name__ == '__main__':
     args = read_cmd()
 
     logging.basicConfig(level=args.verbose_level)
-    ts = time.time()
-    ts = datetime.datetime.fromtimestamp(ts).strftime('%Y_%m_%d_%H:%M:%S')
+    if args.response_cache:
+        openmlpimp.utils.set_response_cache(args.response_cache, ttl=args.response_cache_ttl,
+                                            max_bytes=args.response_cache_max_bytes)
+    if args.metrics_report:
+        openmlpimp.utils.enable_metrics_report(args.metrics_report)
+    if args.fixtures_mode is not None:
+        openmlpimp.utils.install(args.fixtures_mode, args.fixtures_dir, latency=args.fixtures_latency)
     cache_folder = os.path.expanduser("~") + '/experiments/fanova/PIMP_flow%d_cache' %args.flow_id
-    save_folder = os.path.expanduser("~") + '/experiments/fanova/PIMP_flow%d_%s' % (args.flow_id, ts)
+    if args.save_folder is not None:
+        save_folder = args.save_folder
+    else:
+        ts = time.time()
+        ts = datetime.datetime.fromtimestamp(ts).strftime('%Y_%m_%d_%H:%M:%S')
+        save_folder = os.path.expanduser("~") + '/experiments/fanova/PIMP_flow%d_%s' % (args.flow_id, ts)
+    # resuming in an existing save folder requires the same settings
+    run_settings = {name: getattr(args, name) for name in RESULT_SETTINGS}
 
     study = openml.study.get_study(args.openml_studyid, 'tasks')
     print("Tasks: ", list(study.tasks), "(%d)" %len(study.tasks))
 
-    total_ranks = None
-    all_ranks = {}
-    nr_tasks = 0
+    manifest = openmlpimp.utils.ArtifactManifest(cache_folder + '/manifest.json', quota_bytes=args.cache_quota)
+    raw_store = openmlpimp.utils.RawEvaluationStore(args.raw_store) if args.raw_store else None
+
+    # TODO: make the default!
+    ignore_parameters = fixed_parameters_to_ignore_parameters(args.fixed_parameters)
+    cached_paths = openmlpimp.utils.cache_runhistories_configspaces(cache_folder,
+                                                                    args.flow_id,
+                                                                    study.tasks,
+                                                                    model_type=args.model_type,
+                                                                    required_setups=args.required_setups,
+                                                                    reverse=False,
+                                                                    fixed_parameters=args.fixed_parameters,
+                                                                    ignore_parameters=ignore_parameters,
+                                                                    runtime_measure=args.runtime_measure,
+                                                                    manifest=manifest,
+                                                                    raw_store=raw_store)
+
+    if len(cached_paths) == 0:
+        raise ValueError('No tasks with enough setups')
+    with open(next(iter(cached_paths.values()))[1]) as configspace_file:
+        param_names = [param.name for param in read(configspace_file).get_hyperparameters()]
+    progress = openmlpimp.utils.StudyProgress(save_folder + '/progress.json', settings=run_settings)
+
+    # results of tasks that were completed by an earlier (interrupted) run
+    all_ranks = {task_id: load_importances(results_file, param_names)
+                 for task_id, results_file in progress.completed().items()}
+    if len(all_ranks) > 0:
+        print('Resuming %s: %d tasks completed' % (save_folder, len(all_ranks)))
+
     for task_id in study.tasks:
+        if task_id not in cached_paths:
+            print('Skipping task %d: not enough setups' % task_id)
+            continue
+        if task_id in all_ranks:
+            continue
         try:
             task_save_folder = save_folder + "/" + str(task_id)
-            task_cache_folder = cache_folder + "/" + str(task_id)
-
-            # TODO: make the default!
-            ignore_parameters = fixed_parameters_to_ignore_parameters(args.fixed_parameters)
-            runhistory_path, configspace_path = openmlpimp.utils.cache_runhistory_configspace(task_cache_folder,
-                                                                                              args.flow_id,
-                                                                                              task_id,
-                                                                                              model_type=args.model_type,
-                                                                                              required_setups=args.required_setups,
-                                                                                              reverse=False,
-                                                                                              fixed_parameters=args.fixed_parameters,
-                                                                                              ignore_parameters=ignore_parameters)
-
-            if total_ranks is None:
-                with open(configspace_path) as configspace_file:
-                    configspace = read(configspace_file)
-                total_ranks = {param.name: 0 for param in configspace.get_hyperparameters()}
+            runhistory_path, configspace_path = cached_paths[task_id]
 
             if args.modus == 'fanova':
                 print('Running FANOVA backend on task %d' %task_id)
@@ -104,38 +199,45 @@ if __name__ == '__main__':
                                                      n_trees=args.n_trees,
                                                      run_limit=args.limit,
                                                      draw_plots=args.draw_plots,
-                                                     manual_logtransform=True)
+                                                     render_plots=not args.lazy_plots,
+                                                     manual_logtransform=True,
+                                                     n_jobs=None if args.n_jobs == -1 else args.n_jobs,
+                                                     seed=args.seed,
+                                                     variance_cache=args.variance_cache or None,
+                                                     max_interaction_order=args.max_interaction_order,
+                                                     interaction_threshold=args.interaction_threshold,
+                                                     beam_width=args.beam_width,
+                                                     adaptive_tolerance=args.adaptive_tolerance,
+                                                     n_bootstrap=args.n_bootstrap,
+                                                     quantization_levels=args.quantization_levels,
+                                                     percentile_cutoffs=args.percentile_cutoffs)
             else:
                 print('Running PIMP backend [%s] on task %d' %(args.modus, task_id))
                 results_file = PimpBackend.execute(task_save_folder, runhistory_path, configspace_path, modus=args.modus)
 
-            with open(results_file) as result_file:
-                data = json.load(result_file)
-
-                # for pimp backend
-                if 'ablation' in data:
-                    data = data['ablation']
-                    # remove obsolute fields
-                    if '-source-' in data:
-                        del data['-source-']
-                    if '-target-' in data:
-                        del data['-target-']
-                    # add missing fields
-                    for param in total_ranks.keys():
-                        if param not in data:
-                            data[param] = 0.0
-                if 'fanova' in data:
-                    data = data['fanova']
-
-                all_ranks[task_id] = data
-                ranks = openmlpimp.utils.rank_dict(data, reverse=True)
-                total_ranks = openmlpimp.utils.sum_dict_values(total_ranks, ranks, allow_subsets=False)
-                nr_tasks += 1
-                print("Task", task_id, ranks)
+            all_ranks[task_id] = load_importances(results_file, param_names)
+            progress.mark_completed(task_id, results_file)
+            print("Task", task_id, openmlpimp.utils.rank_dict(all_ranks[task_id], reverse=True))
+
+            # the aggregated files always reflect all completed tasks
+            openmlpimp.utils.to_csv_unpivot(all_ranks, args.model_type, save_folder + '/ranks_plain.csv')
+            openmlpimp.utils.to_csv_file(all_ranks, args.model_type, save_folder + '/ranks.csv')
         except Exception as e:
             print('error while executing task %d' %(task_id))
             traceback.print_exc()
+            progress.mark_failed(task_id, repr(e))
+
+    total_ranks = {param_name: 0 for param_name in param_names}
+    for data in all_ranks.values():
+        ranks = openmlpimp.utils.rank_dict(data, reverse=True)
+        total_ranks = openmlpimp.utils.sum_dict_values(total_ranks, ranks, allow_subsets=False)
+    nr_tasks = len(all_ranks)
     total_ranks = openmlpimp.utils.divide_dict_values(total_ranks, nr_tasks)
     print("TOTAL RANKS:", total_ranks, "("+str(nr_tasks)+")")
     openmlpimp.utils.to_csv_unpivot(all_ranks, args.model_type, save_folder + '/ranks_plain.csv')
     openmlpimp.utils.to_csv_file(all_ranks, args.model_type, save_folder + '/ranks.csv')
+
+    render_failures = wait_for_renders()
+    if len(render_failures) > 0:
+        print('Rendering failed for %d tasks (marginals are kept, see render_fanova_marginals.py): %s' %
+              (len(render_failures), sorted(render_failures)))
@@ -0,0 +1,127 @@
+import multiprocessing
+import numpy as np
+import openmlpimp
+
+from multiprocessing import shared_memory
+from openmlpimp.backend.fanova import train_evaluator, interaction_importances
+
+
+# the data of the current bootstrap run, attached from shared memory (per worker process)
+_worker_data = None
+
+
+def _to_shared(array):
+    array = np.ascontiguousarray(array, dtype=np.float64)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=np.float64, buffer=block.buf)[...] = array
+    return block
+
+
+def _attach(X_spec, y_spec, config_space, settings):
+    global _worker_data
+    blocks = [shared_memory.SharedMemory(name=name) for name, _ in [X_spec, y_spec]]
+    X = np.ndarray(X_spec[1], dtype=np.float64, buffer=blocks[0].buf)
+    y = np.ndarray(y_spec[1], dtype=np.float64, buffer=blocks[1].buf)
+    # the blocks are kept, as the arrays use their buffers
+    _worker_data = (blocks, X, y, config_space, settings)
+
+
+def _bootstrap_sample(seed):
+    _, X, y, config_space, settings = _worker_data
+    indices = np.random.RandomState(seed).randint(0, len(y), len(y))
+    evaluator = train_evaluator(X[indices], y[indices], config_space, settings['n_trees'], seed=seed, **settings['kwargs'])
+    return interaction_importances(evaluator, X.shape[1], settings['max_order'],
+                                   threshold=settings['threshold'], beam_width=settings['beam_width'])
+
+
+def bootstrap_importances(X, y, config_space, n_bootstrap, n_trees, max_order=1, confidence=0.95,
+                          threshold=None, beam_width=None, seed=None, n_jobs=1, **kwargs):
+    """
+    Estimates the uncertainty of the (interaction) importances by refitting
+    fANOVA on bootstrap resamples of the runs. The samples are processed by
+    a pool of worker processes, that read X and y from shared memory
+    (instead of receiving a copy per sample).
+
+    Parameters
+    -------
+    X : np.array
+        the configurations (one per row)
+
+    y : np.array
+        the performance per configuration
+
+    config_space : ConfigSpace.ConfigurationSpace
+        the configuration space the columns of X belong to
+
+    n_bootstrap : int
+        the number of bootstrap samples
+
+    n_trees : int
+        the number of trees per forest
+
+    max_order : int
+        the highest order of interactions (see interaction_importances)
+
+    confidence : float
+        the level of the (percentile) confidence intervals
+
+    threshold : float
+        see interaction_importances
+
+    beam_width : int
+        see interaction_importances
+
+    seed : int
+        random seed of the samples and the forests
+
+    n_jobs : int
+        number of processes (None: all cores)
+
+    kwargs : dict
+        passed on to the fANOVA constructor
+
+    Returns
+    -------
+    result : dict[str, dict[str, float]]
+        maps from hyperparameter names (sorted, joined by '__') to the mean,
+        std, lower and upper bound of the importance, and the number of
+        samples in which the subset was computed (relevant when pruning)
+    """
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, n_bootstrap).tolist()
+    settings = {'n_trees': n_trees, 'max_order': max_order, 'threshold': threshold,
+                'beam_width': beam_width, 'kwargs': kwargs}
+    blocks = [_to_shared(X), _to_shared(y)]
+    specs = [(blocks[0].name, np.shape(X)), (blocks[1].name, np.shape(y))]
+    try:
+        if n_jobs > 1:
+            with multiprocessing.Pool(min(n_jobs, n_bootstrap), initializer=_attach,
+                                      initargs=(specs[0], specs[1], config_space, settings)) as pool:
+                samples = pool.map(_bootstrap_sample, seeds)
+        else:
+            _attach(specs[0], specs[1], config_space, settings)
+            samples = [_bootstrap_sample(sample_seed) for sample_seed in seeds]
+    finally:
+        global _worker_data
+        _worker_data = None
+        for block in blocks:
+            block.close()
+            block.unlink()
+    print('%s Computed %d bootstrap samples' % (openmlpimp.utils.get_time(), n_bootstrap))
+
+    names = config_space.get_hyperparameter_names()
+    values = dict()
+    for sample in samples:
+        for subset, importance in sample.items():
+            values.setdefault('__'.join(sorted(names[idx] for idx in subset)), []).append(importance)
+
+    result = dict()
+    for name, importances in values.items():
+        lower, upper = np.percentile(importances, [50 * (1 - confidence), 50 * (1 + confidence)])
+        result[name] = {'mean': float(np.mean(importances)),
+                        'std': float(np.std(importances)),
+                        'lower': float(lower),
+                        'upper': float(upper),
+                        'n_samples': len(importances)}
+    return result
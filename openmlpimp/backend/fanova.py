@@ -1,44 +1,394 @@
 import os
 import json
+import hashlib
+import itertools
 import openmlpimp
 import ConfigSpace
+import pickle
 
 import numpy as np
-import matplotlib
-from matplotlib import pyplot as plt
+import multiprocessing
 
-from ConfigSpace.read_and_write.pcs_new import read
+from ConfigSpace.read_and_write.pcs_new import read, write
 from fanova.fanova import fANOVA as fanova_pyrfr
-from fanova.visualizer import Visualizer
+from openmlpimp.backend.marginals import save_marginals, render_in_background
+
+
+# the trained evaluator, inherited by forked worker processes (never pickled)
+_shared_evaluator = None
+
+
+def _variance_entries(evaluator, subset):
+    # the variance tables of the subset and all its sub-subsets (computed by quantify_importance)
+    entries = dict()
+    for order in range(1, len(subset) + 1):
+        for sub_dims in itertools.combinations(subset, order):
+            entries[sub_dims] = (evaluator.V_U_total[sub_dims], evaluator.V_U_individual[sub_dims])
+    return entries
+
+
+def _quantify_subset(subset):
+    importance = _shared_evaluator.quantify_importance(subset)[subset]['total importance']
+    return subset, importance, _variance_entries(_shared_evaluator, subset)
+
+
+def variance_cache_key(X, y, config_space, n_trees, seed, cutoffs, **kwargs):
+    """
+    Hash of everything that determines a trained fANOVA evaluator: the data,
+    the configuration space and the forest settings.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    settings = {'shape': X.shape, 'n_trees': n_trees, 'seed': seed,
+                'cutoffs': [float(cutoff) for cutoff in cutoffs]}
+    settings.update(kwargs)
+    digest = hashlib.sha256()
+    digest.update(X.tobytes())
+    digest.update(y.tobytes())
+    digest.update(write(config_space).encode('utf-8'))
+    digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def train_evaluator(X, y, config_space, n_trees, seed=None, cutoffs=(-np.inf, np.inf), cache_directory=None, **kwargs):
+    """
+    Trains a fANOVA evaluator. With a cache directory and a seed, the
+    variance tables that were computed for an evaluator trained on the same
+    input before are restored, so that quantify_importance does not compute
+    those marginals again. The forest itself is always retrained, as the
+    pyrfr binary format does not preserve the fANOVA precomputations;
+    with a fixed seed, the retrained forest is the same.
+
+    Parameters
+    -------
+    X : np.array
+        the configurations (one per row)
+
+    y : np.array
+        the performance per configuration
+
+    config_space : ConfigSpace.ConfigurationSpace
+        the configuration space the columns of X belong to
+
+    n_trees : int
+        the number of trees in the forest
+
+    seed : int
+        random seed of the forest (None: random, no caching)
+
+    cutoffs : tuple(float, float)
+        the performance range that is considered
+
+    cache_directory : str
+        directory to store the variance tables in (None: no caching)
+
+    kwargs : dict
+        passed on to the fANOVA constructor (also part of the cache key)
+
+    Returns
+    -------
+    evaluator : fanova.fanova.fANOVA
+    """
+    evaluator = fanova_pyrfr(X=X, Y=y, config_space=config_space, n_trees=n_trees, seed=seed, cutoffs=cutoffs, **kwargs)
+
+    if cache_directory is not None and seed is not None:
+        key = variance_cache_key(X, y, config_space, n_trees, seed, cutoffs, **kwargs)
+        cache_path = os.path.join(cache_directory, key + '.pkl')
+        if os.path.isfile(cache_path):
+            with open(cache_path, 'rb') as fp:
+                tables = pickle.load(fp)
+            evaluator.V_U_total.update(tables['V_U_total'])
+            evaluator.V_U_individual.update(tables['V_U_individual'])
+            print('%s Loaded fANOVA variance tables from cache: %s' % (openmlpimp.utils.get_time(), key))
+        # only valid for the cutoffs of the key (set_cutoffs resets the tables)
+        evaluator._variance_cache = (cache_path, tuple(float(cutoff) for cutoff in cutoffs))
+    return evaluator
+
+
+def save_variance_tables(evaluator):
+    """
+    Stores the variance tables that the evaluator computed so far, if it
+    was trained with a cache directory (see train_evaluator) and its
+    cutoffs were not changed since.
+    """
+    cache = getattr(evaluator, '_variance_cache', None)
+    if cache is None:
+        return
+    cache_path, cutoffs = cache
+    if tuple(float(cutoff) for cutoff in evaluator.cutoffs) != cutoffs:
+        return
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tables = {'V_U_total': evaluator.V_U_total, 'V_U_individual': evaluator.V_U_individual}
+    with openmlpimp.utils.atomic_write(cache_path, 'wb') as fp:
+        pickle.dump(tables, fp, pickle.HIGHEST_PROTOCOL)
+
+
+def _total_importances(evaluator, subsets, n_jobs):
+    """
+    Computes the total importance of each subset of hyperparameter
+    indices. With n_jobs > 1, the subsets are distributed over forked
+    worker processes that share the trained forest; the variance tables
+    they compute are merged back into the evaluator. New variance tables
+    are stored in the cache (see save_variance_tables).
+
+    Returns
+    -------
+    importances : dict[tuple[int], float]
+    """
+    global _shared_evaluator
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    num_tables = len(evaluator.V_U_total)
+    if n_jobs <= 1 or len(subsets) <= 1:
+        importances = {subset: evaluator.quantify_importance(subset)[subset]['total importance'] for subset in subsets}
+    else:
+        _shared_evaluator = evaluator
+        try:
+            with multiprocessing.get_context('fork').Pool(min(n_jobs, len(subsets))) as pool:
+                results = list(pool.imap_unordered(_quantify_subset, subsets))
+        finally:
+            _shared_evaluator = None
+        importances = dict()
+        for subset, importance, entries in results:
+            importances[subset] = importance
+            for sub_dims, (total, individual) in entries.items():
+                evaluator.V_U_total.setdefault(sub_dims, total)
+                evaluator.V_U_individual.setdefault(sub_dims, individual)
+
+    if len(evaluator.V_U_total) > num_tables:
+        save_variance_tables(evaluator)
+    return importances
+
+
+def quantize_runs(X, y, config_space, num_levels):
+    """
+    Bins the numeric hyperparameters into num_levels levels (equal width,
+    on log scale for log hyperparameters) and aggregates the runs that have
+    the same binned configuration into one row with their mean performance.
+    Categorical hyperparameters are left as they are.
+
+    Parameters
+    -------
+    X : np.array
+        the configurations (one per row), in the order of the config space
+
+    y : np.array
+        the performance per configuration
+
+    config_space : ConfigSpace.ConfigurationSpace
+        determines the ranges and scales of the columns of X
+
+    num_levels : int
+        the number of levels per numeric hyperparameter
+
+    Returns
+    -------
+    X_quantized : np.array
+        the unique binned configurations
+
+    y_mean : np.array
+        the mean performance per binned configuration
+
+    counts : np.array
+        the number of runs per binned configuration
+    """
+    X = np.array(X, dtype=np.float64)
+    for idx, param in enumerate(config_space.get_hyperparameters()):
+        if isinstance(param, ConfigSpace.hyperparameters.CategoricalHyperparameter):
+            continue
+        lower, upper, values = param.lower, param.upper, X[:, idx]
+        if param.log:
+            lower, upper, values = np.log(lower), np.log(upper), np.log(values)
+        width = (upper - lower) / num_levels
+        bins = np.clip(np.floor((values - lower) / width), 0, num_levels - 1)
+        centers = lower + (bins + 0.5) * width
+        if param.log:
+            centers = np.exp(centers)
+        if isinstance(param, ConfigSpace.hyperparameters.UniformIntegerHyperparameter):
+            centers = np.round(centers)
+        X[:, idx] = centers
+
+    X_quantized, inverse, counts = np.unique(X, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    y_mean = np.bincount(inverse, weights=y, minlength=len(counts)) / counts
+    return X_quantized, y_mean, counts
+
+
+def _stratified_order(y, num_strata, rng):
+    """
+    Random order of the runs in which every prefix is (approximately)
+    stratified over the performance quantiles.
+    """
+    edges = np.percentile(y, np.linspace(0, 100, num_strata + 1)[1:-1])
+    strata = np.digitize(y, edges)
+    position = np.zeros(len(y))
+    for stratum in np.unique(strata):
+        members = np.where(strata == stratum)[0]
+        # relative position within the stratum interleaves the strata proportionally
+        position[rng.permutation(members)] = (np.arange(len(members)) + rng.uniform()) / len(members)
+    return np.argsort(position, kind='mergesort')
+
+
+def train_adaptive_evaluator(X, y, config_space, tolerance=0.01, initial_trees=8, max_trees=128,
+                             initial_runs=500, max_runs=None, num_strata=10, seed=None,
+                             cache_directory=None, n_jobs=1, **kwargs):
+    """
+    Trains fANOVA evaluators in stages, doubling the number of trees and the
+    (stratified) sample of runs each stage, until the individual importances
+    change at most tolerance compared to the previous stage, or the full
+    budget is used.
+
+    Parameters
+    -------
+    X : np.array
+        the configurations (one per row)
+
+    y : np.array
+        the performance per configuration
+
+    config_space : ConfigSpace.ConfigurationSpace
+        the configuration space the columns of X belong to
+
+    tolerance : float
+        max absolute change of any individual importance between two stages
+
+    initial_trees : int
+        the number of trees in the first stage
+
+    max_trees : int
+        the max number of trees
+
+    initial_runs : int
+        the number of runs in the first stage
+
+    max_runs : int
+        the max number of runs (None: all)
+
+    num_strata : int
+        the number of performance quantiles that runs are stratified over
+
+    seed : int
+        random seed of the sample and the forests
+
+    cache_directory : str
+        see train_evaluator
+
+    n_jobs : int
+        number of processes for computing the importances
+
+    kwargs : dict
+        passed on to the fANOVA constructor
+
+    Returns
+    -------
+    evaluator : fanova.fanova.fANOVA
+        the evaluator of the last stage
+
+    budget : dict
+        the trees and runs used, per stage and in total
+    """
+    rng = np.random.RandomState(seed)
+    order = _stratified_order(y, num_strata, rng)
+    max_runs = len(y) if max_runs is None else min(max_runs, len(y))
+    singles = [(idx,) for idx in range(X.shape[1])]
+
+    n_trees = min(initial_trees, max_trees)
+    n_runs = min(initial_runs, max_runs)
+    previous = None
+    stages = []
+    while True:
+        indices = np.sort(order[:n_runs])
+        evaluator = train_evaluator(X[indices], y[indices], config_space, n_trees, seed=seed,
+                                    cache_directory=cache_directory, **kwargs)
+        importances = _total_importances(evaluator, singles, n_jobs)
+        change = None
+        if previous is not None:
+            change = max(abs(importances[subset] - previous[subset]) for subset in singles)
+        stages.append({'n_trees': n_trees, 'n_runs': n_runs, 'max_change': change})
+        print('%s Adaptive fANOVA stage %d: %d trees, %d runs, max change %s' %
+              (openmlpimp.utils.get_time(), len(stages), n_trees, n_runs, change))
+
+        converged = change is not None and change <= tolerance
+        if converged or (n_trees >= max_trees and n_runs >= max_runs):
+            break
+        previous = importances
+        n_trees = min(n_trees * 2, max_trees)
+        n_runs = min(n_runs * 2, max_runs)
+
+    budget = {'n_trees': n_trees, 'n_runs': n_runs, 'available_runs': len(y),
+              'converged': converged, 'tolerance': tolerance, 'stages': stages}
+    return evaluator, budget
+
+
+def interaction_importances(evaluator, num_params, max_order, threshold=None, beam_width=None, n_jobs=1):
+    """
+    Computes the importance of individual hyperparameters and their
+    interactions up to max_order, level by level. The importance of a
+    subset is its total importance minus that of all its proper subsets. A
+    subset of order k is only considered when all its subsets of order k-1
+    were kept, i.e., had an importance of at least threshold and were among
+    the beam_width most important subsets of their order. Without threshold
+    and beam_width, all combinations are computed.
+
+    Parameters
+    -------
+    evaluator : fanova.fanova.fANOVA
+        the trained evaluator
+
+    num_params : int
+        the number of hyperparameters (columns of X)
+
+    max_order : int
+        the highest order of interactions to consider (1: only individual)
+
+    threshold : float
+        minimal importance of a subset to be expanded (None: no threshold)
+
+    beam_width : int
+        max number of subsets per order to expand (None: unbounded)
+
+    n_jobs : int
+        number of processes (None: all cores)
+
+    Returns
+    -------
+    importances : dict[tuple[int], float]
+        maps from (sorted) tuple of hyperparameter indices to importance
+    """
+    importances = dict()
+    kept = [()]
+    for order in range(1, max_order + 1):
+        kept_lower = set(kept)
+        candidates = []
+        for subset in kept:
+            for idx in range((subset[-1] + 1) if subset else 0, num_params):
+                candidate = subset + (idx,)
+                if all(lower in kept_lower for lower in itertools.combinations(candidate, order - 1)):
+                    candidates.append(candidate)
+        if len(candidates) == 0:
+            break
+
+        total_importance = _total_importances(evaluator, candidates, n_jobs)
+        for subset in candidates:
+            importances[subset] = total_importance[subset]
+            for lower_order in range(1, order):
+                for lower in itertools.combinations(subset, lower_order):
+                    importances[subset] -= importances[lower]
+
+        kept = [subset for subset in candidates if threshold is None or importances[subset] >= threshold]
+        if beam_width is not None:
+            kept = sorted(kept, key=lambda subset: importances[subset], reverse=True)[:beam_width]
+            kept.sort()
+    return importances
 
 
 class FanovaBackend(object):
 
     @staticmethod
-    def _plot_result(fANOVA, configspace, directory, yrange=None):
-        os.makedirs(directory, exist_ok=True)
-        vis = Visualizer(fANOVA, configspace, directory, y_label='Predictive Accuracy')
-
-        for hp1 in configspace.get_hyperparameters():
-            plt.close('all')
-            plt.clf()
-            param = hp1.name
-            outfile_name = os.path.join(directory, param.replace(os.sep, "_") + ".pdf")
-            vis.plot_marginal(configspace.get_idx_by_hyperparameter_name(param), show=False)
-
-            x1, x2, _, _ = plt.axis()
-            if yrange:
-                plt.axis((x1, x2, yrange[0], yrange[1]))
-            plt.savefig(outfile_name)
-
-        pass
-
-    @staticmethod
-    def execute(save_folder, runhistory_location, configspace_location, manual_logtransform, use_percentiles, interaction_effect, n_trees, run_limit=None, draw_plots=True):
-
-        matplotlib.rcParams['ps.useafm'] = True
-        matplotlib.rcParams['pdf.use14corefonts'] = True
-        matplotlib.rcParams['text.usetex'] = True
+    def execute(save_folder, runhistory_location, configspace_location, manual_logtransform, use_percentiles, interaction_effect, n_trees, run_limit=None, draw_plots=True, n_jobs=1, seed=None, variance_cache=None,
+                max_interaction_order=3, interaction_threshold=None, beam_width=None, render_plots=True, num_pairwise_plots=20,
+                adaptive_tolerance=None, n_bootstrap=None, bootstrap_confidence=0.95, quantization_levels=None,
+                percentile_cutoffs=None):
 
         with open(runhistory_location) as runhistory_file:
             runhistory = json.load(runhistory_file)
@@ -50,7 +400,8 @@ class FanovaBackend(object):
         y = []
 
         for item in runhistory['data']:
-            if run_limit is not None and len(X) > run_limit:
+            # in adaptive mode, run_limit bounds the stratified sample instead
+            if run_limit is not None and adaptive_tolerance is None and len(X) > run_limit:
                 break
 
             valid = True
@@ -84,6 +435,16 @@ class FanovaBackend(object):
         if manual_logtransform:
             configspace = openmlpimp.utils.scale_configspace_to_log(configspace)
 
+        if quantization_levels is not None:
+            # fANOVA has no sample weights; the counts are only reported
+            num_runs = len(y)
+            X, y, counts = quantize_runs(X, y, configspace, quantization_levels)
+            quantization = {'levels': quantization_levels, 'runs': num_runs, 'rows': len(y),
+                            'max_count': int(counts.max()), 'mean_count': float(counts.mean())}
+            with open(os.path.join(save_folder, 'fanova_quantization.json'), 'w') as out_file:
+                json.dump(quantization, out_file, sort_keys=True, indent=4, separators=(',', ': '))
+            print('Quantized %d runs into %d rows' % (num_runs, len(y)))
+
         cutoffs = (-np.inf, np.inf)
         if use_percentiles:
             p75 = np.percentile(y, 75.0)
@@ -91,13 +452,26 @@ class FanovaBackend(object):
             cutoffs = (p75, p100)
 
         # start the evaluator
-        evaluator = fanova_pyrfr(X=X, Y=y, config_space=configspace, config_on_hypercube=False, cutoffs=cutoffs, n_trees=n_trees)
+        if adaptive_tolerance is not None:
+            # n_trees is the max number of trees
+            evaluator, budget = train_adaptive_evaluator(X, y, configspace, tolerance=adaptive_tolerance,
+                                                         max_trees=n_trees, max_runs=run_limit, seed=seed,
+                                                         cache_directory=variance_cache, n_jobs=n_jobs,
+                                                         cutoffs=cutoffs, config_on_hypercube=False)
+            with open(os.path.join(save_folder, 'fanova_budget.json'), 'w') as out_file:
+                json.dump(budget, out_file, sort_keys=True, indent=4, separators=(',', ': '))
+        else:
+            evaluator = train_evaluator(X, y, configspace, n_trees, seed=seed, cutoffs=cutoffs,
+                                        cache_directory=variance_cache, config_on_hypercube=False)
         # obtain the results
         params = configspace.get_hyperparameters()
         result = {}
 
+        importances = interaction_importances(evaluator, len(params), max_interaction_order if interaction_effect else 1,
+                                              threshold=interaction_threshold, beam_width=beam_width, n_jobs=n_jobs)
+
         for idx, param in enumerate(params):
-            importance = evaluator.quantify_importance([idx])[(idx,)]['total importance']
+            importance = importances[(idx,)]
             result[param.name] = importance
 
         # store main results to disk
@@ -106,51 +480,19 @@ class FanovaBackend(object):
             json.dump(result, out_file, sort_keys=True, indent=4, separators=(',', ': '))
             print('Saved individuals to %s' %os.path.join(save_folder, filename))
 
-
-        # call plotting fn
-        yrange = (0, 1)
-        if use_percentiles:
-            yrange = (p75, p100)
-        if draw_plots:
-            FanovaBackend._plot_result(evaluator, configspace, save_folder + '/fanova', yrange)
-
         if interaction_effect:
             result_interaction = {}
-            for idx, param in enumerate(params):
-                for idx2, param2 in enumerate(params):
-                    if param.name >= param2.name: # string comparison cause stable
-                        continue
-                    print('interaction effects between', param.name, param2.name)
-                    interaction = evaluator.quantify_importance([idx, idx2])[(idx,idx2)]['total importance']
-                    interaction -= result[param.name]
-                    interaction -= result[param2.name]
-                    combined_name = param.name + '__' + param2.name
-                    if interaction < 0.0:
-                        raise ValueError('interaction score too low. Params: %s score %d' %(combined_name, interaction))
-                    result_interaction[combined_name] = interaction
-
-            for idx, param in enumerate(params):
-                for idx2, param2 in enumerate(params):
-                    if param.name >= param2.name:  # string comparison cause stable
-                        continue
-                    for idx3, param3 in enumerate(params):
-                        if param2.name >= param3.name:  # string comparison cause stable
-                            continue
-
-                        print('interaction effects between', param.name, param2.name, param3.name)
-                        interaction = evaluator.quantify_importance([idx, idx2, idx3])[(idx, idx2, idx3)]['total importance']
-                        interaction -= result[param.name]
-                        interaction -= result[param2.name]
-                        interaction -= result[param3.name]
-                        combined_name = param.name + '__' + param2.name + '__' + param3.name
-
-                        interaction -= result_interaction[param.name + '__' + param2.name]
-                        interaction -= result_interaction[param2.name + '__' + param3.name]
-                        interaction -= result_interaction[param.name + '__' + param3.name]
-
-                        if interaction < 0.0:
-                            raise ValueError('interaction score too low. Params: %s score %d' % (combined_name, interaction))
-                        result_interaction[combined_name] = interaction
+            for subset in sorted(importances, key=len):
+                if len(subset) == 1:
+                    continue
+                # names ordered by string comparison cause stable
+                names = sorted(params[idx].name for idx in subset)
+                print('interaction effects between', *names)
+                interaction = importances[subset]
+                combined_name = '__'.join(names)
+                if interaction < 0.0:
+                    raise ValueError('interaction score too low. Params: %s score %d' % (combined_name, interaction))
+                result_interaction[combined_name] = interaction
 
             # store interaction effects to disk
 
@@ -161,8 +503,50 @@ class FanovaBackend(object):
             with open(os.path.join(save_folder, filename), 'w') as out_file:
                 json.dump(result_interaction, out_file, sort_keys=True, indent=4, separators=(',', ': '))
                 print('Saved interactions to %s' %os.path.join(save_folder, filename))
-            if draw_plots:
-                vis = Visualizer(evaluator, configspace, save_folder + '/fanova', y_label='Predictive Accuracy')
-                vis.create_most_important_pairwise_marginal_plots()
+
+        if percentile_cutoffs is not None:
+            # the forest does not depend on the cutoffs; only the variance
+            # decomposition is recomputed for every range
+            result_cutoffs = {}
+            for lower, upper in percentile_cutoffs:
+                current_cutoffs = (np.percentile(y, lower), np.percentile(y, upper))
+                evaluator.set_cutoffs(current_cutoffs)
+                current = interaction_importances(evaluator, len(params), max_interaction_order if interaction_effect else 1,
+                                                  threshold=interaction_threshold, beam_width=beam_width, n_jobs=n_jobs)
+                result_cutoffs['p%s-p%s' % (lower, upper)] = {
+                    'cutoffs': [float(cutoff) for cutoff in current_cutoffs],
+                    'importance': {'__'.join(sorted(params[idx].name for idx in subset)): importance
+                                   for subset, importance in current.items()}}
+            evaluator.set_cutoffs(cutoffs)
+            cutoffs_file = os.path.join(save_folder, 'pimp_values_fanova_cutoffs.json')
+            with open(cutoffs_file, 'w') as out_file:
+                json.dump(result_cutoffs, out_file, sort_keys=True, indent=4, separators=(',', ': '))
+                print('Saved importance per cutoff to %s' % cutoffs_file)
+
+        if n_bootstrap is not None:
+            # imported here, as the bootstrap module builds on this one
+            from openmlpimp.backend.bootstrap import bootstrap_importances
+            bootstrap_result = bootstrap_importances(X, y, configspace, n_bootstrap, n_trees,
+                                                     max_order=max_interaction_order if interaction_effect else 1,
+                                                     confidence=bootstrap_confidence,
+                                                     threshold=interaction_threshold, beam_width=beam_width,
+                                                     seed=seed, n_jobs=n_jobs,
+                                                     cutoffs=cutoffs, config_on_hypercube=False)
+            bootstrap_file = os.path.join(save_folder, 'pimp_values_fanova_bootstrap.json')
+            with open(bootstrap_file, 'w') as out_file:
+                json.dump(bootstrap_result, out_file, sort_keys=True, indent=4, separators=(',', ': '))
+                print('Saved bootstrap intervals to %s' % bootstrap_file)
+
+        if draw_plots:
+            # only the marginals are computed here; figures are rendered by
+            # background processes (render_plots) or later, from the arrays
+            yrange = (0, 1)
+            if use_percentiles:
+                yrange = (p75, p100)
+            pairs = sorted([subset for subset in importances if len(subset) == 2], key=lambda subset: importances[subset], reverse=True)
+            pairs = [(params[idx].name, params[idx2].name) for idx, idx2 in pairs[:num_pairwise_plots]]
+            marginals_path = save_marginals(evaluator, configspace, save_folder + '/fanova', pairs, yrange=yrange)
+            if render_plots:
+                render_in_background(marginals_path)
 
         return save_folder + "/" + filename
@@ -0,0 +1,198 @@
+import numpy as np
+import openmlpimp
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from fanova.visualizer import Visualizer
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+MARGINALS_FILE = 'marginals.npz'
+
+
+def _grid_array(values):
+    values = np.asarray(values)
+    if values.dtype.kind not in 'biuf':
+        values = values.astype(str)
+    return values
+
+
+def save_marginals(evaluator, configspace, directory, pairs=(), resolution=100, yrange=None, pairwise_resolution=20):
+    """
+    Computes the marginals of all hyperparameters (and of the given pairs)
+    and stores them as compressed arrays, so that figures can be rendered
+    later (see render_marginals) without the trained evaluator.
+
+    Parameters
+    -------
+    evaluator : fanova.fanova.fANOVA
+        the trained evaluator
+
+    configspace : ConfigSpace.ConfigurationSpace
+        the configuration space that the evaluator was trained on
+
+    directory : str
+        the directory to store the marginals in
+
+    pairs : list[tuple(str, str)]
+        pairs of hyperparameter names to store the pairwise marginals of
+
+    resolution : int
+        number of grid points per (numeric) hyperparameter
+
+    yrange : tuple(float, float)
+        default y-axis range of the single marginal figures
+
+    pairwise_resolution : int
+        number of grid points per (numeric) hyperparameter of the pairwise
+        marginals (quadratic in the number of predictions, hence lower)
+
+    Returns
+    -------
+    path : str
+        the file the marginals were stored in
+    """
+    # the visualizer requires an existing directory
+    os.makedirs(directory, exist_ok=True)
+    vis = Visualizer(evaluator, configspace, directory, y_label='Predictive Accuracy')
+    names = configspace.get_hyperparameter_names()
+    arrays = {'names': np.array(names), 'pairs': np.array(pairs, dtype=str).reshape((-1, 2)),
+              'yrange': np.array(yrange if yrange else [], dtype=float)}
+    for name in names:
+        param = configspace.get_hyperparameter(name)
+        idx = configspace.get_idx_by_hyperparameter_name(name)
+        marginal = vis.generate_marginal(idx, resolution)
+        arrays[name + '/mean'] = np.asarray(marginal[0])
+        arrays[name + '/std'] = np.asarray(marginal[1])
+        # visualizer returns mean, std and the grid for numeric hyperparameters
+        arrays[name + '/grid'] = _grid_array(marginal[2] if len(marginal) > 2 else param.choices)
+    for first, second in pairs:
+        indices = [configspace.get_idx_by_hyperparameter_name(first), configspace.get_idx_by_hyperparameter_name(second)]
+        grids, zz = vis.generate_pairwise_marginal(indices, pairwise_resolution)
+        arrays[first + '__' + second + '/x'] = _grid_array(grids[0])
+        arrays[first + '__' + second + '/y'] = _grid_array(grids[1])
+        arrays[first + '__' + second + '/z'] = np.asarray(zz)
+
+    path = os.path.join(directory, MARGINALS_FILE)
+    with openmlpimp.utils.atomic_write(path, 'wb') as fp:
+        np.savez_compressed(fp, **arrays)
+    return path
+
+
+def _set_ticks(set_ticks, set_labels, grid, max_ticks=8):
+    positions = np.unique(np.linspace(0, len(grid) - 1, min(len(grid), max_ticks)).astype(int))
+    set_ticks(positions)
+    if grid.dtype.kind in 'f':
+        set_labels(['%.3g' % grid[position] for position in positions])
+    else:
+        set_labels([str(grid[position]) for position in positions])
+
+
+def _render_marginal(name, mean, std, grid, outfile, yrange):
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    if grid.dtype.kind in 'biuf' and len(grid) == len(mean) and len(grid) > 2:
+        ax.plot(grid, mean)
+        ax.fill_between(grid, mean - std, mean + std, alpha=0.3)
+    else:
+        positions = np.arange(len(mean))
+        ax.errorbar(positions, mean, yerr=std, fmt='o')
+        ax.set_xticks(positions)
+        ax.set_xticklabels([str(value) for value in grid])
+    ax.set_xlabel(name)
+    ax.set_ylabel('Predictive Accuracy')
+    if yrange:
+        ax.set_ylim(yrange)
+    figure.savefig(outfile)
+
+
+def _render_pairwise(first, second, x, y, zz, outfile):
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    image = ax.imshow(np.asarray(zz).T, origin='lower', aspect='auto')
+    figure.colorbar(image, ax=ax)
+    _set_ticks(ax.set_xticks, ax.set_xticklabels, x)
+    _set_ticks(ax.set_yticks, ax.set_yticklabels, y)
+    ax.set_xlabel(first)
+    ax.set_ylabel(second)
+    figure.savefig(outfile)
+
+
+def render_marginals(marginals_path, directory=None, yrange=None, extension='pdf'):
+    """
+    Renders the figures of marginals that were stored by save_marginals.
+    Uses the Agg canvas directly (no LaTeX, no pyplot state), so it is safe
+    to run in background processes.
+
+    Returns
+    -------
+    files : list[str]
+        the rendered figures
+    """
+    if directory is None:
+        directory = os.path.dirname(marginals_path)
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    with np.load(marginals_path) as arrays:
+        if yrange is None and len(arrays['yrange']) == 2:
+            yrange = tuple(arrays['yrange'])
+        for name in arrays['names']:
+            outfile = os.path.join(directory, name.replace(os.sep, '_') + '.' + extension)
+            _render_marginal(name, arrays[name + '/mean'], arrays[name + '/std'], arrays[name + '/grid'], outfile, yrange)
+            files.append(outfile)
+        for first, second in arrays['pairs']:
+            key = first + '__' + second
+            outfile = os.path.join(directory, key.replace(os.sep, '_') + '.' + extension)
+            _render_pairwise(first, second, arrays[key + '/x'], arrays[key + '/y'], arrays[key + '/z'], outfile)
+            files.append(outfile)
+    return files
+
+
+_render_executor = None
+# the submitted (marginals path, future) pairs, until wait_for_renders
+_render_futures = []
+
+
+def _log_render_failure(marginals_path, future):
+    if not future.cancelled() and future.exception() is not None:
+        print('%s Rendering %s failed: %r' % (openmlpimp.utils.get_time(), marginals_path, future.exception()))
+
+
+def render_in_background(marginals_path, directory=None, yrange=None, extension='pdf', n_workers=2):
+    """
+    Submits render_marginals to a pool of background processes, so that the
+    caller does not wait for the figures. Pending figures are completed
+    before the interpreter exits; failures are logged when they occur, and
+    reported by wait_for_renders.
+
+    Returns
+    -------
+    future : concurrent.futures.Future
+    """
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ProcessPoolExecutor(max_workers=n_workers)
+    future = _render_executor.submit(render_marginals, marginals_path, directory, yrange, extension)
+    future.add_done_callback(lambda done: _log_render_failure(marginals_path, done))
+    _render_futures.append((marginals_path, future))
+    return future
+
+
+def wait_for_renders():
+    """
+    Waits for all figures submitted by render_in_background.
+
+    Returns
+    -------
+    failures : dict[str, Exception]
+        maps from the marginals file to the error of the failed renders
+    """
+    failures = dict()
+    while len(_render_futures) > 0:
+        marginals_path, future = _render_futures.pop(0)
+        if future.exception() is not None:
+            failures[marginals_path] = future.exception()
+    return failures
@@ -0,0 +1,365 @@
+import copy
+import csv
+import json
+import multiprocessing
+import numpy as np
+import openmlpimp
+import os
+
+from ConfigSpace.configuration_space import ConfigurationSpace
+from ConfigSpace.hyperparameters import CategoricalHyperparameter, UniformFloatHyperparameter
+from fanova.visualizer import Visualizer
+from openmlpimp.backend.fanova import train_evaluator, train_adaptive_evaluator, interaction_importances, quantize_runs
+
+
+RESULT_COLUMNS = ['task_id', 'hyperparameter', 'n_hyperparameters', 'importance_variance', 'importance_max_min']
+
+# the partitioned meta-dataset and settings, inherited by forked worker processes
+_shared_task = None
+
+
+def _task_rows(task_id):
+    X, y, task_indices, config_space, settings = _shared_task
+    X_task, y_task = X[task_indices[task_id]], y[task_indices[task_id]]
+    if settings['quantization_levels'] is not None:
+        X_task, y_task, _ = quantize_runs(X_task, y_task, config_space, settings['quantization_levels'])
+    budget = None
+    if settings['adaptive_tolerance'] is not None:
+        evaluator, budget = train_adaptive_evaluator(X_task, y_task, config_space,
+                                                     tolerance=settings['adaptive_tolerance'],
+                                                     max_trees=settings['n_trees'],
+                                                     seed=settings['seed'],
+                                                     cache_directory=settings['variance_cache'])
+    else:
+        evaluator = train_evaluator(X_task, y_task, config_space,
+                                    n_trees=settings['n_trees'],
+                                    seed=settings['seed'],
+                                    cache_directory=settings['variance_cache'])
+    vis = Visualizer(evaluator, config_space, settings['output_directory'], y_label='Predictive Accuracy')
+    hyperparameter_names = np.array(config_space.get_hyperparameter_names())
+
+    importances = interaction_importances(evaluator, len(hyperparameter_names), settings['comb_size'],
+                                          threshold=settings['interaction_threshold'],
+                                          beam_width=settings['beam_width'])
+    rows = []
+    for idx in sorted(importances, key=lambda subset: (len(subset), subset)):
+        param_names = hyperparameter_names[np.array(idx)]
+        if len(idx) == 1:
+            # visualizer returns mean, std and potentially grid
+            avg_marginal = np.array(vis.generate_marginal(idx[0], settings['resolution'])[0])
+        elif len(idx) == 2:
+            # visualizer returns grid names and values
+            avg_marginal = np.array(vis.generate_pairwise_marginal(idx, settings['resolution'])[1])
+        else:
+            # the visualizer has no marginals for higher dimensions
+            avg_marginal = None
+        if avg_marginal is not None:
+            difference_max_min = max(avg_marginal.reshape((-1,))) - min(avg_marginal.reshape((-1,)))
+        else:
+            difference_max_min = np.nan
+
+        rows.append({
+            'task_id': task_id,
+            'hyperparameter': ' / '.join(param_names),
+            'n_hyperparameters': len(param_names),
+            'importance_variance': importances[idx],
+            'importance_max_min': difference_max_min,
+        })
+    return task_id, rows, budget
+
+
+def run_on_meta_dataset(data, config_space, measure, output_path,
+                        n_trees=16,
+                        comb_size=2,
+                        resolution=100,
+                        interaction_threshold=None,
+                        beam_width=None,
+                        seed=None,
+                        variance_cache=None,
+                        adaptive_tolerance=None,
+                        quantization_levels=None,
+                        n_jobs=1):
+    """
+    Runs fANOVA on every task of a meta-dataset (e.g., as created by
+    openmlpimp.utils.export_meta_dataset). The meta-dataset is partitioned
+    by task once; tasks are processed in forked worker processes and the
+    result rows of a task are appended to the csv as soon as it finishes.
+
+    Parameters
+    -------
+    data : pd.DataFrame
+        integer encoded meta-dataset, with a column per hyperparameter, the
+        measure and task_id
+
+    config_space : ConfigSpace.ConfigurationSpace
+        the configuration space of the hyperparameter columns
+
+    measure : str
+        the column to explain
+
+    output_path : str
+        the csv file to write the results to (one row per task and subset)
+
+    n_trees : int
+        the number of trees per forest (the maximum, in adaptive mode)
+
+    comb_size : int
+        the max interaction order
+
+    resolution : int
+        resolution of the marginals (for importance_max_min)
+
+    interaction_threshold : float
+        see openmlpimp.backend.fanova.interaction_importances
+
+    beam_width : int
+        see openmlpimp.backend.fanova.interaction_importances
+
+    seed : int
+        random seed of the forests
+
+    variance_cache : str
+        directory to cache fANOVA variance tables in (see
+        openmlpimp.backend.fanova.train_evaluator; None: no caching)
+
+    adaptive_tolerance : float
+        if set, the forests and run samples grow until the importances are
+        stable within this tolerance (see train_adaptive_evaluator). The
+        budget per task is written next to the csv (<output>_budget.json)
+
+    quantization_levels : int
+        if set, the runs of a task are binned and aggregated first (see
+        openmlpimp.backend.fanova.quantize_runs)
+
+    n_jobs : int
+        number of tasks that are processed in parallel (None: all cores)
+
+    Returns
+    -------
+    num_tasks : int
+        the number of tasks that were processed
+    """
+    global _shared_task
+    if measure not in data.columns.values:
+        raise ValueError('Could not find measure in dataset: %s' % measure)
+    X = data[config_space.get_hyperparameter_names()].values
+    y = data[measure].values
+    task_indices = data.groupby('task_id').indices
+    task_ids = list(task_indices.keys())
+    output_directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_directory, exist_ok=True)
+    settings = {'n_trees': n_trees, 'comb_size': comb_size, 'resolution': resolution,
+                'interaction_threshold': interaction_threshold, 'beam_width': beam_width,
+                'seed': seed, 'variance_cache': variance_cache, 'output_directory': output_directory,
+                'adaptive_tolerance': adaptive_tolerance, 'quantization_levels': quantization_levels}
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+
+    _shared_task = (X, y, task_indices, config_space, settings)
+    pool = None
+    try:
+        if n_jobs > 1:
+            pool = multiprocessing.get_context('fork').Pool(min(n_jobs, len(task_ids)))
+            results = pool.imap_unordered(_task_rows, task_ids)
+        else:
+            results = map(_task_rows, task_ids)
+
+        with open(output_path, 'w', newline='') as fp:
+            # same layout as pd.DataFrame.to_csv (with an index column)
+            writer = csv.writer(fp)
+            writer.writerow([''] + RESULT_COLUMNS)
+            num_rows = 0
+            budgets = dict()
+            for idx, (task_id, rows, budget) in enumerate(results):
+                for row in rows:
+                    writer.writerow([num_rows] + [row[column] for column in RESULT_COLUMNS])
+                    num_rows += 1
+                fp.flush()
+                if budget is not None:
+                    budgets[int(task_id)] = budget
+                print('%s Finished fanova on task %d (%d/%d)' % (openmlpimp.utils.get_time(), task_id, idx + 1, len(task_ids)))
+        if adaptive_tolerance is not None:
+            with openmlpimp.utils.atomic_write(os.path.splitext(output_path)[0] + '_budget.json') as fp:
+                json.dump(budgets, fp, sort_keys=True, indent=4, separators=(',', ': '))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        _shared_task = None
+    return len(task_ids)
+
+
+# meta-features that are available for (almost) all tasks and cheap to interpret
+DEFAULT_QUALITIES = ['NumberOfInstances', 'NumberOfFeatures', 'NumberOfClasses', 'MajorityClassPercentage']
+
+# the joint evaluator and settings, inherited by forked worker processes
+_shared_joint = None
+
+
+def _joint_config_space(config_space, qualities, values):
+    joint = ConfigurationSpace()
+    for hyperparameter in config_space.get_hyperparameters():
+        joint.add_hyperparameter(copy.deepcopy(hyperparameter))
+    for idx, quality in enumerate(qualities):
+        lower, upper = float(np.min(values[:, idx])), float(np.max(values[:, idx]))
+        log = lower > 0 and upper / lower > 100
+        joint.add_hyperparameter(UniformFloatHyperparameter(quality, lower=lower, upper=upper, log=log))
+    return joint
+
+
+def _conditional_marginals(task_id):
+    evaluator, config_space, task_values, resolution = _shared_joint
+    num_params = len(config_space.get_hyperparameters())
+    quality_dims = list(range(num_params, num_params + len(task_values[task_id])))
+    marginals = dict()
+    for idx, hyperparameter in enumerate(config_space.get_hyperparameters()):
+        if isinstance(hyperparameter, CategoricalHyperparameter):
+            grid = range(len(hyperparameter.choices))
+        else:
+            grid = np.linspace(hyperparameter.lower, hyperparameter.upper, resolution)
+        marginals[hyperparameter.name] = np.array([
+            evaluator.marginal_mean_variance_for_values([idx] + quality_dims, [value] + list(task_values[task_id]))[0]
+            for value in grid])
+    return task_id, marginals
+
+
+def run_joint_meta_dataset(data, config_space, measure, task_qualities, output_path,
+                           qualities=None,
+                           n_trees=16,
+                           comb_size=1,
+                           resolution=20,
+                           seed=None,
+                           variance_cache=None,
+                           n_jobs=1):
+    """
+    Trains a single fANOVA model on all tasks of a meta-dataset, with the
+    task meta-features as additional inputs. From this model, the global
+    importance of the hyperparameters and meta-features is derived, as well
+    as a per task importance: the marginal of each hyperparameter,
+    conditioned on the meta-features of the task. Per task, the variance of
+    these conditional marginals is normalized over the hyperparameters.
+
+    Parameters
+    -------
+    data : pd.DataFrame
+        integer encoded meta-dataset, with a column per hyperparameter, the
+        measure and task_id
+
+    config_space : ConfigSpace.ConfigurationSpace
+        the configuration space of the hyperparameter columns
+
+    measure : str
+        the column to explain
+
+    task_qualities : dict[int, dict[str, float]]
+        the meta-features per task (e.g., KDD2018/data/fanova/task_qualities.json).
+        Tasks without (all) meta-features are left out
+
+    output_path : str
+        the csv file to write the per task results to (same columns as
+        run_on_meta_dataset). The global importances are written next to it
+        (<output>_global.json)
+
+    qualities : list[str]
+        the meta-features to use (default: DEFAULT_QUALITIES); meta-features
+        that are constant over the tasks are left out
+
+    n_trees : int
+        the number of trees of the forest
+
+    comb_size : int
+        the max interaction order of the global importances
+
+    resolution : int
+        number of grid points of the conditional marginals
+
+    seed : int
+        random seed of the forest
+
+    variance_cache : str
+        directory to cache fANOVA variance tables in (see
+        openmlpimp.backend.fanova.train_evaluator; None: no caching)
+
+    n_jobs : int
+        number of processes (None: all cores)
+
+    Returns
+    -------
+    global_importance : dict[str, float]
+        maps from (sorted, joined by '__') hyperparameter and meta-feature
+        names to importance
+    """
+    global _shared_joint
+    if measure not in data.columns.values:
+        raise ValueError('Could not find measure in dataset: %s' % measure)
+    if qualities is None:
+        qualities = DEFAULT_QUALITIES
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+
+    task_values = dict()
+    for task_id in data['task_id'].unique():
+        values = [task_qualities.get(int(task_id), dict()).get(quality) for quality in qualities]
+        if any(value is None or np.isnan(value) for value in values):
+            print('%s Leaving out task %d: missing meta-features' % (openmlpimp.utils.get_time(), task_id))
+            continue
+        task_values[task_id] = np.array(values, dtype=np.float64)
+    if len(task_values) == 0:
+        raise ValueError('No tasks with all meta-features: %s' % qualities)
+    # a constant meta-feature can not be a dimension of the joint model
+    values = np.array(list(task_values.values()))
+    varying = [idx for idx in range(len(qualities)) if np.max(values[:, idx]) > np.min(values[:, idx])]
+    if len(varying) < len(qualities):
+        print('%s Leaving out constant meta-features: %s' %
+              (openmlpimp.utils.get_time(), [quality for idx, quality in enumerate(qualities) if idx not in varying]))
+        if len(varying) == 0:
+            raise ValueError('All meta-features are constant over the tasks: %s' % qualities)
+        qualities = [qualities[idx] for idx in varying]
+        task_values = {task_id: task_value[varying] for task_id, task_value in task_values.items()}
+    data = data[data['task_id'].isin(list(task_values.keys()))]
+
+    task_rows = data.groupby('task_id').indices
+    task_ids = list(task_rows.keys())
+    X = np.array(data[config_space.get_hyperparameter_names()].values, dtype=np.float64)
+    Q = np.zeros((len(X), len(qualities)))
+    for task_id, indices in task_rows.items():
+        Q[indices] = task_values[task_id]
+    joint_config_space = _joint_config_space(config_space, qualities, np.array(list(task_values.values())))
+    evaluator = train_evaluator(np.hstack((X, Q)), data[measure].values, joint_config_space,
+                                n_trees=n_trees, seed=seed, cache_directory=variance_cache)
+    print('%s Trained joint model on %d runs of %d tasks' % (openmlpimp.utils.get_time(), len(X), len(task_ids)))
+
+    names = joint_config_space.get_hyperparameter_names()
+    importances = interaction_importances(evaluator, len(names), comb_size, n_jobs=n_jobs)
+    global_importance = {'__'.join(sorted(names[idx] for idx in subset)): importance
+                         for subset, importance in importances.items()}
+
+    _shared_joint = (evaluator, config_space, task_values, resolution)
+    pool = None
+    try:
+        if n_jobs > 1:
+            pool = multiprocessing.get_context('fork').Pool(min(n_jobs, len(task_ids)))
+            results = pool.imap_unordered(_conditional_marginals, task_ids)
+        else:
+            results = map(_conditional_marginals, task_ids)
+
+        with open(output_path, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow([''] + RESULT_COLUMNS)
+            num_rows = 0
+            for task_id, marginals in results:
+                variances = {name: float(np.var(marginal)) for name, marginal in marginals.items()}
+                total_variance = sum(variances.values())
+                for name, marginal in marginals.items():
+                    importance = variances[name] / total_variance if total_variance > 0 else 0.0
+                    writer.writerow([num_rows, task_id, name, 1, importance, float(marginal.max() - marginal.min())])
+                    num_rows += 1
+                fp.flush()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        _shared_joint = None
+
+    with openmlpimp.utils.atomic_write(os.path.splitext(output_path)[0] + '_global.json') as fp:
+        json.dump({'qualities': qualities, 'num_tasks': len(task_ids), 'num_runs': len(X),
+                   'importance': global_importance}, fp, sort_keys=True, indent=4, separators=(',', ': '))
+    return global_importance
@@ -1,9 +1,17 @@
 from .convert import config_to_classifier, classifier_to_pipeline, obtain_classifier, runhistory_to_trajectory, setups_to_configspace, modeltype_to_classifier, scale_configspace_to_log
-from .connect import task_counts, obtain_runhistory_and_configspace, cache_runhistory_configspace
+from .connect import task_counts, decode_config_value, list_paginated, obtain_runhistory_and_configspace, obtain_runhistories, iterate_runhistory, stream_runhistory_to_file, cache_runhistory_configspace, cache_runhistories_configspaces
 from .config_space import get_config_space, get_config_space_casualnames
-from .filesystem import obtain_marginal_contributions
+from .filesystem import obtain_marginal_contributions, atomic_write
 from .dictutils import rank_dict, sum_dict_values, divide_dict_values
 from .misc import get_time, fixed_parameters_to_suffix, do_run, name_mapping
 from .optimize import obtain_parameters, obtain_parameter_combinations, get_excluded_params, get_param_values, obtain_paramgrid, obtain_runids
 from .plot import to_csv_file, to_csv_unpivot, obtain_performance_curves, plot_task, boxplot_traces, average_rank
-from .priors import obtain_priors, get_kde_paramgrid, get_uniform_paramgrid, rv_discrete_wrapper
+from .priors import obtain_priors, refresh_task_setup_scores, get_kde_paramgrid, get_uniform_paramgrid, rv_discrete_wrapper
+from .offline import SyntheticRunListing, FixtureStore, install, record, replay
+from .manifest import ArtifactManifest, artifact_key
+from .progress import StudyProgress
+from .rawstore import RawEvaluationStore
+from .cache import ResponseCache, cached_call, call_through_cache, set_response_cache, get_response_cache
+from .client import openml_call, openml_call_uncached, get_metrics, reset_metrics, write_metrics_report, enable_metrics_report
+from .metadataset import export_meta_dataset
+from .prefetch import TaskPrefetcher, PrefetchedTask
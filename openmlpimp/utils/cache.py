@@ -0,0 +1,173 @@
+import hashlib
+import openml
+import os
+import pickle
+import tempfile
+import time
+
+
+def _function_name(fn):
+    module = getattr(fn, '__module__', None) or type(fn).__module__
+    name = getattr(fn, '__qualname__', None) or type(fn).__qualname__
+    return module + '.' + name
+
+
+def _normalize(value):
+    # makes the representation independent of dict / set ordering
+    if isinstance(value, dict):
+        return '{' + ', '.join(sorted('%s: %s' % (_normalize(k), _normalize(v)) for k, v in value.items())) + '}'
+    elif isinstance(value, (set, frozenset)):
+        return '{' + ', '.join(sorted(_normalize(item) for item in value)) + '}'
+    elif isinstance(value, (list, tuple)):
+        return '[' + ', '.join(_normalize(item) for item in value) + ']'
+    return repr(value)
+
+
+class ResponseCache(object):
+    """
+    Content-addressed on-disk cache for responses of the OpenML API. Every
+    entry is a pickle, keyed by the hash of the called function and its
+    arguments.
+
+    Parameters
+    -------
+    directory : str
+        a directory on the filesystem to store the cache in
+
+    ttl : float
+        seconds after which an entry is considered stale (None: never)
+
+    max_bytes : int
+        size quota of the cache. When exceeded, the least recently used
+        entries are removed (None: unbounded)
+    """
+    def __init__(self, directory, ttl=None, max_bytes=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(fn, args, kwargs):
+        description = openml.config.server + _function_name(fn) + _normalize(list(args)) + _normalize(kwargs)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl')
+
+    def get(self, key):
+        """
+        Returns a tuple (hit, value). Updates the access time of the entry,
+        which is used for the LRU eviction.
+        """
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False, None
+        now = time.time()
+        if self.ttl is not None and now - stat.st_mtime > self.ttl:
+            self._remove(path)
+            return False, None
+        try:
+            with open(path, 'rb') as fp:
+                value = pickle.load(fp)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return False, None
+        os.utime(path, (now, stat.st_mtime))
+        return True, value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(value, fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        if self.max_bytes is not None:
+            self.evict()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """
+        Returns a list of (access time, size, path) tuples of all entries
+        """
+        result = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if not filename.endswith('.pkl'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                result.append((stat.st_atime, stat.st_size, path))
+        return result
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self._remove(path)
+
+
+_response_cache = None
+
+
+def set_response_cache(directory, ttl=None, max_bytes=None):
+    """
+    Configures the process-wide response cache that cached_call uses.
+    Passing directory=None disables caching.
+    """
+    global _response_cache
+    if directory is None:
+        _response_cache = None
+    else:
+        _response_cache = ResponseCache(directory, ttl=ttl, max_bytes=max_bytes)
+    return _response_cache
+
+
+def get_response_cache():
+    return _response_cache
+
+
+def call_through_cache(fn, args, kwargs):
+    """
+    Calls fn(*args, **kwargs) through the response cache (if configured).
+    Exceptions are not cached.
+
+    Returns
+    -------
+    value, hit : mixed, bool
+        the response and whether it was obtained from the cache (None if
+        no cache is configured)
+    """
+    cache = _response_cache
+    if cache is None:
+        return fn(*args, **kwargs), None
+
+    key = ResponseCache.key(fn, args, kwargs)
+    hit, value = cache.get(key)
+    if hit:
+        return value, True
+    value = fn(*args, **kwargs)
+    cache.put(key, value)
+    return value, False
+
+
+def cached_call(fn, *args, **kwargs):
+    return call_through_cache(fn, args, kwargs)[0]
@@ -0,0 +1,147 @@
+import atexit
+import json
+import openmlpimp
+import os
+import pickle
+import threading
+import time
+
+
+# upper bounds (in ms) of the latency histogram buckets
+LATENCY_BUCKETS = [2 ** exponent for exponent in range(0, 17)]
+
+
+class CallMetrics(object):
+    """
+    Aggregated metrics of all calls to one OpenML function
+    """
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.payload_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add(self, latency, payload_bytes, cache_hit, error):
+        self.count += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and latency * 1000 > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.latency_histogram[bucket] += 1
+        if error:
+            self.errors += 1
+        if payload_bytes is not None:
+            self.payload_bytes += payload_bytes
+        if cache_hit is True:
+            self.cache_hits += 1
+        elif cache_hit is False:
+            self.cache_misses += 1
+
+    def to_dict(self):
+        labels = ['<=%dms' % bound for bound in LATENCY_BUCKETS] + ['>%dms' % LATENCY_BUCKETS[-1]]
+        lookups = self.cache_hits + self.cache_misses
+        return {'count': self.count,
+                'errors': self.errors,
+                'total_latency': self.total_latency,
+                'mean_latency': self.total_latency / self.count if self.count > 0 else None,
+                'max_latency': self.max_latency,
+                'latency_histogram': {label: n for label, n in zip(labels, self.latency_histogram) if n > 0},
+                'payload_bytes': self.payload_bytes,
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+                'cache_hit_ratio': self.cache_hits / lookups if lookups > 0 else None}
+
+
+_metrics = dict()
+_metrics_lock = threading.Lock()
+_report_path = None
+
+
+def _name(fn):
+    return getattr(fn, '__name__', None) or type(fn).__name__
+
+
+def _payload_size(value):
+    # only measured when a report is requested, as it requires serialization
+    if _report_path is None:
+        return None
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+
+
+def _record(fn, start, value, cache_hit, error):
+    latency = time.time() - start
+    payload = None if error else _payload_size(value)
+    with _metrics_lock:
+        if _name(fn) not in _metrics:
+            _metrics[_name(fn)] = CallMetrics()
+        _metrics[_name(fn)].add(latency, payload, cache_hit, error)
+
+
+def openml_call(fn, *args, **kwargs):
+    """
+    Calls an OpenML function through the response cache (see
+    set_response_cache) and records its latency, payload size and whether
+    it was a cache hit.
+    """
+    start = time.time()
+    try:
+        value, hit = openmlpimp.utils.call_through_cache(fn, args, kwargs)
+    except Exception:
+        _record(fn, start, None, None, True)
+        raise
+    _record(fn, start, value, hit, False)
+    return value
+
+
+def openml_call_uncached(fn, *args, **kwargs):
+    """
+    Like openml_call, but bypasses the response cache (e.g., for calls that
+    have their own cache, or that should always hit the server)
+    """
+    start = time.time()
+    try:
+        value = fn(*args, **kwargs)
+    except Exception:
+        _record(fn, start, None, None, True)
+        raise
+    _record(fn, start, value, None, False)
+    return value
+
+
+def get_metrics():
+    with _metrics_lock:
+        return {name: metrics.to_dict() for name, metrics in _metrics.items()}
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def write_metrics_report(path):
+    with openmlpimp.utils.atomic_write(path) as fp:
+        json.dump({'pid': os.getpid(), 'calls': get_metrics()}, fp, sort_keys=True, indent=4, separators=(',', ': '))
+
+
+def enable_metrics_report(path):
+    """
+    Enables measuring payload sizes and writes the metrics of all OpenML
+    calls as json to path when the process exits. Setting the environment
+    variable OPENMLPIMP_METRICS_REPORT has the same effect.
+    """
+    global _report_path
+    if _report_path is None:
+        atexit.register(lambda: write_metrics_report(_report_path))
+    _report_path = path
+
+
+if os.environ.get('OPENMLPIMP_METRICS_REPORT'):
+    enable_metrics_report(os.environ['OPENMLPIMP_METRICS_REPORT'] % {'pid': os.getpid()})
@@ -1,55 +1,244 @@
+import collections
 import copy
+import fasteners
+import functools
 import openml
 import openmlpimp
 import openmlcontrib
 
 import os
 import json
+import shutil
+import tempfile
 
+from concurrent.futures import ThreadPoolExecutor
 from openml.exceptions import OpenMLServerException
 
 from ConfigSpace.read_and_write.pcs_new import write
 
 
-def task_counts(flow_id):
-    task_ids = {}
-    offset = 0
-    limit = 10000
-    while True:
-        try:
-            runs = openml.runs.list_runs(flow=[flow_id], size=limit, offset=offset)
-        except OpenMLServerException:
-            runs = {}
+def _fetch_page(listing_fn, offset, size, use_cache, kwargs):
+    try:
+        if not use_cache:
+            return openmlpimp.utils.openml_call_uncached(listing_fn, size=size, offset=offset, **kwargs)
+        return openmlpimp.utils.openml_call(listing_fn, size=size, offset=offset, **kwargs)
+    except OpenMLServerException:
+        # the server raises when the offset runs past the last result
+        return {}
+
+
+def list_paginated(listing_fn, batch_size=10000, n_workers=4, offset=0, use_cache=True, **kwargs):
+    """
+    Iterates over all pages of an OpenML listing call (e.g.,
+    openml.runs.list_runs), keeping up to n_workers offset pages in flight.
+
+    Parameters
+    -------
+    listing_fn : callable
+        listing function that accepts size and offset keyword arguments
+
+    batch_size : int
+        number of results per page
+
+    n_workers : int
+        maximum number of pages that are requested concurrently
+
+    offset : int
+        offset of the first page
+
+    use_cache : bool
+        whether pages go through the response cache (see openml_call)
 
+    kwargs : dict
+        additional filters that are passed to the listing function
+
+    Returns
+    -------
+    pages : generator[dict]
+        the pages, in order of offset. Iteration stops after the first page
+        that contains less than batch_size results.
+    """
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        pending = collections.deque()
+        while True:
+            while len(pending) < n_workers:
+                pending.append(executor.submit(_fetch_page, listing_fn, offset, batch_size, use_cache, kwargs))
+                offset += batch_size
+            page = pending.popleft().result()
+            yield page
+            if len(page) < batch_size:
+                for future in pending:
+                    future.cancel()
+                return
+
+
+def task_counts(flow_id, batch_size=10000, n_workers=4, listing_fn=None):
+    if listing_fn is None:
+        listing_fn = openml.runs.list_runs
+
+    task_ids = {}
+    for runs in list_paginated(listing_fn, batch_size=batch_size, n_workers=n_workers, flow=[flow_id]):
         for run_id, run in runs.items():
             task_id = run['task_id']
             if task_id not in task_ids:
                 task_ids[task_id] = 0
             task_ids[task_id] += 1
-        if len(runs) < limit:
-            break
-        else:
-            offset += limit
     return task_ids
 
 
+def _obtain_config_space(model_type, fixed_parameters, ignore_parameters):
+    all_fixed_parameters = copy.deepcopy(ignore_parameters) if ignore_parameters is not None else set()
+    if fixed_parameters is not None:
+        all_fixed_parameters.update(fixed_parameters)
+    return openmlpimp.utils.get_config_space_casualnames(model_type, all_fixed_parameters)
+
+
+def _filter_setups(setups, fixed_parameters):
+    if fixed_parameters is not None:
+        for param, value in fixed_parameters.items():
+            print('restricting', param, value)
+            setups = openmlcontrib.setups.filter_setup_list(setups, param, allowed_values=[value])
+    return setups
+
+
+@functools.lru_cache(maxsize=4096)
+def _decode_config_value(value):
+    # parameter values are strings (json / flow serialized); the same few
+    # hundred distinct values occur across all setups and tasks
+    decoded = openml.flows.flow_to_sklearn(value)
+    # TODO: hack
+    if isinstance(decoded, bool):
+        decoded = str(decoded)
+    return decoded
+
+
+def decode_config_value(value):
+    decoded = _decode_config_value(value)
+    if not isinstance(decoded, (str, int, float, type(None))):
+        # do not hand out the cached (mutable) object itself
+        decoded = copy.deepcopy(decoded)
+    return decoded
+
+
+class _ParameterIndex(object):
+    """
+    Maps the OpenML parameter ids (which are shared by all setups of a flow)
+    to hyperparameter names, keeping only the parameters that belong in the
+    runhistory configs. The index is extended when a setup contains unseen
+    parameter ids.
+    """
+    def __init__(self, keyfield, valid_hyperparameters, fixed_parameters, ignore_parameters):
+        self.keyfield = keyfield
+        self.valid_hyperparameters = valid_hyperparameters
+        self.fixed_parameters = fixed_parameters
+        self.ignore_parameters = ignore_parameters
+        self.seen = set()
+        self.index = dict()
+
+    def _extend(self, parameters):
+        for param_id in parameters.keys() - self.seen:
+            self.seen.add(param_id)
+            name = getattr(parameters[param_id], self.keyfield)
+            if self.ignore_parameters is not None and name in self.ignore_parameters:
+                continue
+            if self.fixed_parameters is not None and name in self.fixed_parameters:
+                continue
+            if name not in self.valid_hyperparameters:
+                continue
+            self.index[param_id] = name
+
+    def setup_to_config(self, setup):
+        parameters = setup.parameters
+        if not self.seen.issuperset(parameters.keys()):
+            self._extend(parameters)
+        return {name: decode_config_value(parameters[param_id].value)
+                for param_id, name in self.index.items() if param_id in parameters}
+
+
+def _obtain_runtimes(runtime_measure, flow_id, task_ids=None, run_ids=None, runs_per_call=500, raw_store=None):
+    """
+    Obtains the runtimes (in seconds) of runs, either of all runs on the
+    given tasks or of the given run ids.
+
+    Parameters
+    -------
+    runtime_measure : str
+        the OpenML evaluation measure, e.g., 'usercpu_time_millis' or
+        'run_cpu_time'. Measures ending in '_millis' are converted to seconds
+
+    Returns
+    -------
+    runtimes : dict[int, float]
+        maps from run id to the runtime in seconds
+    """
+    factor = 0.001 if runtime_measure.endswith('_millis') else 1.0
+    if raw_store is not None and task_ids is not None:
+        evaluations = dict()
+        for task_evaluations in raw_store.get_evaluations(flow_id, task_ids, function=runtime_measure).values():
+            evaluations.update(task_evaluations)
+    elif run_ids is not None:
+        run_ids = sorted(run_ids)
+        evaluations = dict()
+        for start in range(0, len(run_ids), runs_per_call):
+            evaluations.update(openmlpimp.utils.openml_call(openml.evaluations.list_evaluations, function=runtime_measure,
+                                                            flow=[flow_id], id=run_ids[start:start + runs_per_call]))
+    else:
+        evaluations = openmlpimp.utils.openml_call(openml.evaluations.list_evaluations, function=runtime_measure,
+                                                   flow=[flow_id], task=list(task_ids))
+    return {run_id: evaluation.value * factor for run_id, evaluation in evaluations.items()}
+
+
+def _evaluation_to_record(evaluation, task_id, runtimes=None):
+    from smac.tae.execute_ta_run import StatusType
+
+    cost = evaluation.value
+    runtime = 0.0 # not available, unless runtimes were obtained
+    if runtimes is not None and evaluation.run_id in runtimes:
+        runtime = runtimes[evaluation.run_id]
+    status = {"__enum__": str(StatusType.SUCCESS)}
+    additional = {}
+    performance = [cost, runtime, status, additional]
+
+    instance = openml.config.server + "task/" + str(task_id)
+    seed = 1  # not relevant
+    run = [evaluation.setup_id, instance, seed]
+    return [run, performance]
+
+
+def _evaluations_to_runhistory(evaluations, setups, task_id, config_space, param_index, runtimes=None):
+    data = []
+    configs = {}
+    applicable_setups = set()
+    for run_id in evaluations.keys():
+        config_id = evaluations[run_id].setup_id
+        if config_id in setups:
+            if not openmlcontrib.setups.setup_in_config_space(setups[config_id], config_space):
+                continue
+
+            applicable_setups.add(config_id)
+            data.append(_evaluation_to_record(evaluations[run_id], task_id, runtimes))
+
+    for setup_id in applicable_setups:
+        configs[setup_id] = param_index.setup_to_config(setups[setup_id])
+
+    return {"data": data, "configs": configs}
+
+
 def obtain_runhistory_and_configspace(flow_id, task_id,
                                       model_type,
                                       keyfield='parameter_name',
                                       required_setups=None,
                                       fixed_parameters=None,
                                       ignore_parameters=None,
-                                      reverse=False):
-    from smac.tae.execute_ta_run import StatusType
-
-    all_fixed_parameters = copy.deepcopy(ignore_parameters)
-    if fixed_parameters is not None:
-        all_fixed_parameters.update(fixed_parameters)
+                                      reverse=False,
+                                      runtime_measure=None,
+                                      raw_store=None):
+    config_space = _obtain_config_space(model_type, fixed_parameters, ignore_parameters)
 
-    config_space = openmlpimp.utils.get_config_space_casualnames(model_type, all_fixed_parameters)
-    valid_hyperparameters = config_space._hyperparameters.keys()
-
-    evaluations = openml.evaluations.list_evaluations(function="predictive_accuracy", flow=[flow_id], task=[task_id])
+    if raw_store is not None:
+        evaluations = raw_store.get_evaluations(flow_id, [task_id])[task_id]
+    else:
+        evaluations = openmlpimp.utils.openml_call(openml.evaluations.list_evaluations, function="predictive_accuracy", flow=[flow_id], task=[task_id])
     setup_ids = set()
     for run_id in evaluations.keys():
         setup_ids.add(evaluations[run_id].setup_id)
@@ -58,10 +247,11 @@ def obtain_runhistory_and_configspace(flow_id, task_id,
         if len(setup_ids) < required_setups:
             raise ValueError('Not enough (evaluated) setups found on OpenML. Found %d; required: %d' %(len(setup_ids), required_setups))
 
-    setups = openmlcontrib.setups.obtain_setups_by_ids(setup_ids)
-    for param, value in fixed_parameters.items():
-        print('restricting', param, value)
-        setups = openmlcontrib.setups.filter_setup_list(setups, param, allowed_values=[value])
+    if raw_store is not None:
+        setups = raw_store.get_setups(flow_id, setup_ids)
+    else:
+        setups = openmlpimp.utils.openml_call(openmlcontrib.setups.obtain_setups_by_ids, setup_ids)
+    setups = _filter_setups(setups, fixed_parameters)
     print('Setup count; before %d after %d' %(len(setup_ids), len(setups)))
     setup_ids = set(setups.keys())
 
@@ -70,80 +260,368 @@ def obtain_runhistory_and_configspace(flow_id, task_id,
         if len(setup_ids) < required_setups:
             raise ValueError('Not enough (evaluated) setups left after filtering. Got %d; required: %d' %(len(setup_ids), required_setups))
 
-    data = []
-    configs = {}
-    applicable_setups = set()
-    for run_id in evaluations.keys():
-        config_id = evaluations[run_id].setup_id
-        if config_id in setup_ids:
-            if not openmlcontrib.setups.setup_in_config_space(setups[config_id], config_space):
-                continue
+    runtimes = None
+    if runtime_measure is not None:
+        runtimes = _obtain_runtimes(runtime_measure, flow_id, task_ids=[task_id], raw_store=raw_store)
+
+    param_index = _ParameterIndex(keyfield, config_space._hyperparameters.keys(), fixed_parameters, ignore_parameters)
+    run_history = _evaluations_to_runhistory(evaluations, setups, task_id, config_space, param_index, runtimes)
+
+    if reverse:
+        openmlpimp.utils.reverse_runhistory(run_history)
 
-            cost = evaluations[run_id].value
-            runtime = 0.0 # not easily accessible
-            status = {"__enum__": str(StatusType.SUCCESS)}
-            additional = {}
-            performance = [cost, runtime, status, additional]
+    return run_history, config_space
 
-            instance = openml.config.server + "task/" + str(task_id)
-            seed = 1  # not relevant
-            run = [config_id, instance, seed]
 
-            applicable_setups.add(config_id)
-            data.append([run, performance])
+def obtain_runhistories(flow_id, task_ids,
+                        model_type,
+                        keyfield='parameter_name',
+                        required_setups=None,
+                        fixed_parameters=None,
+                        ignore_parameters=None,
+                        reverse=False,
+                        runtime_measure=None,
+                        tasks_per_call=50,
+                        raw_store=None):
+    """
+    Bulk version of obtain_runhistory_and_configspace. Lists the
+    evaluations of many tasks per call and downloads every setup only
+    once, even when it was evaluated on several tasks.
 
-    for setup_id in applicable_setups:
-        config = {}
-        for param_id in setups[setup_id].parameters:
-            name = getattr(setups[setup_id].parameters[param_id], keyfield)
-            value = openml.flows.flow_to_sklearn(setups[setup_id].parameters[param_id].value)
-            if ignore_parameters is not None and name in ignore_parameters:
-                continue
-            if fixed_parameters is not None and name in fixed_parameters:
-                continue
-            if name not in valid_hyperparameters:
+    Parameters
+    -------
+    flow_id : int
+        the flow id of the classifier
+
+    task_ids : list[int]
+        the OpenML task ids to obtain the runhistories for
+
+    model_type : str
+        the classifier (e.g., 'libsvm_svc'), determines the config space
+
+    required_setups : int
+        tasks that (after filtering) have less setups are left out
+
+    runtime_measure : str
+        if given, the runtimes of the runs are obtained with this OpenML
+        evaluation measure (e.g., 'usercpu_time_millis') and stored in the
+        runhistory. Otherwise, the runtime is 0.0
+
+    tasks_per_call : int
+        number of task ids that are combined in one list_evaluations call
+
+    raw_store : RawEvaluationStore
+        if given, evaluations and setups are read from (and added to) this
+        store instead of being obtained from OpenML directly
+
+    Returns
+    -------
+    result : dict[int, tuple(dict, ConfigSpace.ConfigurationSpace)]
+        maps from task id to the runhistory and config space. All tasks
+        share the same config space object.
+    """
+    config_space = _obtain_config_space(model_type, fixed_parameters, ignore_parameters)
+    task_ids = list(task_ids)
+
+    runtimes = None
+    if raw_store is not None:
+        task_evaluations = raw_store.get_evaluations(flow_id, task_ids, tasks_per_call=tasks_per_call)
+        if runtime_measure is not None:
+            runtimes = _obtain_runtimes(runtime_measure, flow_id, task_ids=task_ids, raw_store=raw_store)
+    else:
+        task_evaluations = {task_id: dict() for task_id in task_ids}
+        if runtime_measure is not None:
+            runtimes = dict()
+        for start in range(0, len(task_ids), tasks_per_call):
+            evaluations = openmlpimp.utils.openml_call(openml.evaluations.list_evaluations, function="predictive_accuracy",
+                                                       flow=[flow_id], task=task_ids[start:start + tasks_per_call])
+            for run_id, evaluation in evaluations.items():
+                task_evaluations[evaluation.task_id][run_id] = evaluation
+            if runtime_measure is not None:
+                runtimes.update(_obtain_runtimes(runtime_measure, flow_id, task_ids=task_ids[start:start + tasks_per_call]))
+
+    task_setup_ids = dict()
+    for task_id, evaluations in task_evaluations.items():
+        setup_ids = {evaluation.setup_id for evaluation in evaluations.values()}
+        if required_setups is not None and len(setup_ids) < required_setups:
+            print('Task %d: not enough (evaluated) setups found on OpenML. Found %d; required: %d' % (task_id, len(setup_ids), required_setups))
+            continue
+        task_setup_ids[task_id] = setup_ids
+
+    all_setup_ids = set()
+    for setup_ids in task_setup_ids.values():
+        all_setup_ids |= setup_ids
+    if raw_store is not None:
+        setups = raw_store.get_setups(flow_id, all_setup_ids)
+    else:
+        setups = openmlpimp.utils.openml_call(openmlcontrib.setups.obtain_setups_by_ids, all_setup_ids)
+    setups = _filter_setups(setups, fixed_parameters)
+    print('Setup count (all tasks); before %d after %d' % (len(all_setup_ids), len(setups)))
+
+    # one index for all tasks, as the parameter ids are shared by all setups of the flow
+    param_index = _ParameterIndex(keyfield, config_space._hyperparameters.keys(), fixed_parameters, ignore_parameters)
+    result = dict()
+    for task_id, setup_ids in task_setup_ids.items():
+        task_setups = {setup_id: setups[setup_id] for setup_id in setup_ids if setup_id in setups}
+        if required_setups is not None and len(task_setups) < required_setups:
+            print('Task %d: not enough (evaluated) setups left after filtering. Got %d; required: %d' % (task_id, len(task_setups), required_setups))
+            continue
+
+        run_history = _evaluations_to_runhistory(task_evaluations[task_id], task_setups, task_id, config_space, param_index, runtimes)
+        if reverse:
+            openmlpimp.utils.reverse_runhistory(run_history)
+        result[task_id] = (run_history, config_space)
+    return result
+
+
+def iterate_runhistory(flow_id, task_id,
+                       model_type,
+                       keyfield='parameter_name',
+                       fixed_parameters=None,
+                       ignore_parameters=None,
+                       reverse=False,
+                       runtime_measure=None,
+                       batch_size=10000,
+                       n_workers=2):
+    """
+    Streaming version of obtain_runhistory_and_configspace. Evaluations are
+    listed page by page; the setups of each page are obtained (once) and
+    filtered against the config space on the fly. Memory usage is bounded
+    by n_workers pages, independent of the number of runs.
+
+    Returns
+    -------
+    records : generator[tuple(list, int, dict)]
+        per applicable run: the runhistory data record, the setup id and the
+        config of the setup. The config is only given the first time a setup
+        occurs; afterwards it is None.
+    """
+    config_space = _obtain_config_space(model_type, fixed_parameters, ignore_parameters)
+    param_index = _ParameterIndex(keyfield, config_space._hyperparameters.keys(), fixed_parameters, ignore_parameters)
+
+    accepted = set()
+    rejected = set()
+    for evaluations in list_paginated(openml.evaluations.list_evaluations, batch_size=batch_size, n_workers=n_workers,
+                                      function="predictive_accuracy", flow=[flow_id], task=[task_id]):
+        new_setup_ids = {evaluation.setup_id for evaluation in evaluations.values()} - accepted - rejected
+        new_configs = dict()
+        if len(new_setup_ids) > 0:
+            setups = openmlpimp.utils.openml_call(openmlcontrib.setups.obtain_setups_by_ids, new_setup_ids)
+            setups = _filter_setups(setups, fixed_parameters)
+            for setup_id in new_setup_ids:
+                if setup_id in setups and openmlcontrib.setups.setup_in_config_space(setups[setup_id], config_space):
+                    accepted.add(setup_id)
+                    new_configs[setup_id] = param_index.setup_to_config(setups[setup_id])
+                else:
+                    rejected.add(setup_id)
+
+        runtimes = None
+        if runtime_measure is not None:
+            run_ids = [run_id for run_id, evaluation in evaluations.items() if evaluation.setup_id in accepted]
+            runtimes = _obtain_runtimes(runtime_measure, flow_id, run_ids=run_ids)
+
+        for run_id, evaluation in evaluations.items():
+            if evaluation.setup_id not in accepted:
                 continue
-            # TODO: hack
-            if isinstance(value, bool):
-                value = str(value)
-            config[name] = value
-        configs[setup_id] = config
+            record = _evaluation_to_record(evaluation, task_id, runtimes)
+            if reverse:
+                openmlpimp.utils.reverse_runhistory({'data': [record]})
+            yield record, evaluation.setup_id, new_configs.pop(evaluation.setup_id, None)
 
-    run_history = {"data": data, "configs": configs}
 
-    if reverse:
-        openmlpimp.utils.reverse_runhistory(run_history)
+def stream_runhistory_to_file(runhistory_path, flow_id, task_id, model_type, required_setups=None, **kwargs):
+    """
+    Writes the runhistory of iterate_runhistory incrementally to
+    runhistory_path (same format as the runhistory.json files). Records are
+    written as they arrive; configs are buffered in a temporary file and
+    appended at the end. The file only appears when complete.
 
-    return run_history, config_space
+    Returns
+    -------
+    num_records, num_setups : int, int
+        the number of runs and (applicable) setups written
+    """
+    num_records = 0
+    num_setups = 0
+    with openmlpimp.utils.atomic_write(runhistory_path) as outfile, tempfile.TemporaryFile('w+') as configs_file:
+        outfile.write('{"data": [')
+        for record, setup_id, config in iterate_runhistory(flow_id, task_id, model_type, **kwargs):
+            if num_records > 0:
+                outfile.write(',')
+            outfile.write('\n  ')
+            json.dump(record, outfile)
+            num_records += 1
+            if config is not None:
+                if num_setups > 0:
+                    configs_file.write(',')
+                configs_file.write('\n  %s: ' % json.dumps(str(setup_id)))
+                json.dump(config, configs_file)
+                num_setups += 1
+
+        if required_setups is not None and num_setups < required_setups:
+            # aborts the atomic write; no file is created
+            raise ValueError('Not enough (evaluated) setups left after filtering. Got %d; required: %d' % (num_setups, required_setups))
+
+        outfile.write('\n], "configs": {')
+        configs_file.seek(0)
+        shutil.copyfileobj(configs_file, outfile)
+        outfile.write('\n}}\n')
+    return num_records, num_setups
 
 
-def cache_runhistory_configspace(save_folder, flow_id, task_id, model_type, required_setups, reverse=False, fixed_parameters=None, ignore_parameters=None):
+def _cache_paths(save_folder, fixed_parameters, ignore_parameters=None, required_setups=None, reverse=False, runtime_measure=None):
     if fixed_parameters:
         save_folder_suffix = [param + '_' + value for param, value in fixed_parameters.items()]
         save_folder_suffix = '/' + '__'.join(save_folder_suffix)
     else:
         save_folder_suffix = '/vanilla'
 
-    runhistory_path = save_folder + save_folder_suffix + '/runhistory.json'
+    # all settings that change the content of the runhistory are part of the path
+    settings = ['ignore_' + ('-'.join(sorted(ignore_parameters)) if ignore_parameters else 'none'),
+                'min_%s' % required_setups]
+    if reverse:
+        settings.append('reverse')
+    save_folder_suffix += '/' + '__'.join(settings)
+
+    if runtime_measure is None:
+        runhistory_path = save_folder + save_folder_suffix + '/runhistory.json'
+    else:
+        runhistory_path = save_folder + save_folder_suffix + '/runhistory_%s.json' % runtime_measure
     configspace_path = save_folder + save_folder_suffix + '/config_space.pcs'
-    print(runhistory_path, configspace_path)
+    return runhistory_path, configspace_path
 
-    if not os.path.isfile(runhistory_path) or not os.path.isfile(configspace_path):
-        runhistory, configspace = openmlpimp.utils.obtain_runhistory_and_configspace(flow_id, task_id, model_type,
-                                                                                     required_setups=required_setups,
-                                                                                     fixed_parameters=fixed_parameters,
-                                                                                     ignore_parameters=ignore_parameters,
-                                                                                     reverse=reverse)
 
-        os.makedirs(save_folder + save_folder_suffix, exist_ok=True)
+def _store_runhistory_configspace(runhistory, configspace, runhistory_path, configspace_path):
+    # written to temporary files first, so other processes never observe a
+    # partially written cache entry
+    with openmlpimp.utils.atomic_write(configspace_path) as outfile:
+        outfile.write(write(configspace))
 
-        with open(runhistory_path, 'w') as outfile:
-            json.dump(runhistory, outfile, indent=2)
+    with openmlpimp.utils.atomic_write(runhistory_path) as outfile:
+        json.dump(runhistory, outfile, indent=2)
 
-        with open(configspace_path, 'w') as outfile:
-            outfile.write(write(configspace))
-    else:
+
+def _is_cached(runhistory_path, configspace_path):
+    return os.path.isfile(runhistory_path) and os.path.isfile(configspace_path)
+
+
+def _manifest_key(flow_id, task_id, fixed_parameters, ignore_parameters, required_setups, reverse, runtime_measure):
+    kind = 'runhistory_min%s' % required_setups
+    if reverse:
+        kind += '_reverse'
+    if runtime_measure is not None:
+        kind += '_' + runtime_measure
+    return openmlpimp.utils.artifact_key(kind, flow_id, task_id, fixed_parameters, ignore_parameters)
+
+
+def cache_runhistory_configspace(save_folder, flow_id, task_id, model_type, required_setups, reverse=False, fixed_parameters=None, ignore_parameters=None, streaming=False, runtime_measure=None, manifest=None, raw_store=None):
+    if manifest is not None:
+        manifest_key = _manifest_key(flow_id, task_id, fixed_parameters, ignore_parameters, required_setups, reverse, runtime_measure)
+        files = manifest.lookup(manifest_key)
+        if files is not None:
+            print('[Obtained from cache manifest]')
+            return tuple(files)
+
+    runhistory_path, configspace_path = _cache_paths(save_folder, fixed_parameters, ignore_parameters, required_setups, reverse, runtime_measure)
+    print(runhistory_path, configspace_path)
+
+    if _is_cached(runhistory_path, configspace_path):
         print('[Obtained from cache]')
+        if manifest is not None:
+            manifest.register(manifest_key, [runhistory_path, configspace_path])
+        return runhistory_path, configspace_path
 
+    # single flight: one process obtains the data, the others wait for it
+    os.makedirs(os.path.dirname(runhistory_path), exist_ok=True)
+    lock = fasteners.InterProcessLock(os.path.join(os.path.dirname(runhistory_path), 'cache.lock'))
+    with lock:
+        if _is_cached(runhistory_path, configspace_path):
+            print('[Obtained from cache, populated by other process]')
+        elif streaming:
+            # config space first; the runhistory is what marks the entry as complete
+            configspace = _obtain_config_space(model_type, fixed_parameters, ignore_parameters)
+            with openmlpimp.utils.atomic_write(configspace_path) as outfile:
+                outfile.write(write(configspace))
+            stream_runhistory_to_file(runhistory_path, flow_id, task_id, model_type,
+                                      required_setups=required_setups,
+                                      fixed_parameters=fixed_parameters,
+                                      ignore_parameters=ignore_parameters,
+                                      reverse=reverse,
+                                      runtime_measure=runtime_measure)
+        else:
+            runhistory, configspace = openmlpimp.utils.obtain_runhistory_and_configspace(flow_id, task_id, model_type,
+                                                                                         required_setups=required_setups,
+                                                                                         fixed_parameters=fixed_parameters,
+                                                                                         ignore_parameters=ignore_parameters,
+                                                                                         reverse=reverse,
+                                                                                         runtime_measure=runtime_measure,
+                                                                                         raw_store=raw_store)
+            _store_runhistory_configspace(runhistory, configspace, runhistory_path, configspace_path)
+
+    if manifest is not None:
+        manifest.register(manifest_key, [runhistory_path, configspace_path])
     # now the files are guaranteed to exists
     return runhistory_path, configspace_path
+
+
+def cache_runhistories_configspaces(cache_folder, flow_id, task_ids, model_type, required_setups, reverse=False, fixed_parameters=None, ignore_parameters=None, runtime_measure=None, manifest=None, raw_store=None):
+    """
+    Bulk version of cache_runhistory_configspace. Tasks that are not cached
+    yet are obtained together through obtain_runhistories. The cache of
+    task t is stored in cache_folder/t (same layout as
+    cache_runhistory_configspace). Concurrent bulk calls on the same cache
+    folder are serialized, so every task is obtained only once. If a
+    manifest (ArtifactManifest) is given, cached tasks are looked up in it,
+    and newly cached tasks are registered.
+
+    Returns
+    -------
+    result : dict[int, tuple(str, str)]
+        maps from task id to the runhistory and config space path. Tasks
+        without enough setups are left out.
+    """
+    def key(task_id):
+        return _manifest_key(flow_id, task_id, fixed_parameters, ignore_parameters, required_setups, reverse, runtime_measure)
+
+    def register(task_id, paths):
+        result[task_id] = paths
+        if manifest is not None:
+            # the tasks in the result are used by the caller; never evict them
+            manifest.register(key(task_id), paths, protect=[key(other) for other in result])
+
+    def find_missing():
+        missing = list()
+        for task_id in task_ids:
+            if manifest is not None:
+                files = manifest.lookup(key(task_id))
+                if files is not None:
+                    result[task_id] = tuple(files)
+                    continue
+            paths = _cache_paths(cache_folder + '/' + str(task_id), fixed_parameters, ignore_parameters, required_setups, reverse, runtime_measure)
+            if _is_cached(*paths):
+                register(task_id, paths)
+            else:
+                missing.append(task_id)
+        return missing
+
+    result = dict()
+    if len(find_missing()) > 0:
+        os.makedirs(cache_folder, exist_ok=True)
+        with fasteners.InterProcessLock(os.path.join(cache_folder, 'cache.lock')):
+            missing = find_missing()
+            print('%s Cached tasks: %d; to obtain: %d' % (openmlpimp.utils.get_time(), len(result), len(missing)))
+            if len(missing) > 0:
+                runhistories = obtain_runhistories(flow_id, missing, model_type,
+                                                   required_setups=required_setups,
+                                                   fixed_parameters=fixed_parameters,
+                                                   ignore_parameters=ignore_parameters,
+                                                   reverse=reverse,
+                                                   runtime_measure=runtime_measure,
+                                                   raw_store=raw_store)
+                for task_id, (runhistory, configspace) in runhistories.items():
+                    paths = _cache_paths(cache_folder + '/' + str(task_id), fixed_parameters, ignore_parameters, required_setups, reverse, runtime_measure)
+                    _store_runhistory_configspace(runhistory, configspace, paths[0], paths[1])
+                    register(task_id, paths)
+    if manifest is not None:
+        manifest.flush()
+    return result
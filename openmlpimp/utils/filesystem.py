@@ -1,7 +1,37 @@
 import collections
+import contextlib
 import openmlpimp
 import os
 import json
+import tempfile
+
+
+# the process umask can only be read by setting it; done once, at import
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    """
+    Opens a temporary file next to path for writing. When the block exits
+    without an exception, the temporary file replaces path, so readers see
+    either the old or the new content, never a partial one. The file gets
+    the permissions of a regularly created file (mkstemp creates it owner
+    only).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as fp:
+            yield fp
+        os.chmod(tmp_path, 0o666 & ~_umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 def obtain_marginal_contributions(result_directory):
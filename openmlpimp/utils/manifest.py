@@ -0,0 +1,178 @@
+import atexit
+import fasteners
+import json
+import openmlpimp
+import os
+import time
+
+
+def artifact_key(kind, flow_id, task_id=None, fixed_parameters=None, ignore_parameters=None, version=None):
+    """
+    Creates the manifest key of a derived artifact (e.g., a cached
+    runhistory or a kde cache), based on what it was derived from.
+
+    Parameters
+    -------
+    kind : str
+        the type of artifact, e.g., 'runhistory' or 'kde'
+
+    flow_id : int
+        the flow id of the classifier
+
+    task_id : int
+        the task id (None for artifacts that span tasks)
+
+    fixed_parameters : dict[str, str]
+        the fixed parameters that the artifact was created with
+
+    ignore_parameters : iterable[str]
+        the ignored parameters that the artifact was created with
+
+    version : str
+        code version; defaults to the openmlpimp version
+
+    Returns
+    -------
+    key : str
+    """
+    if version is None:
+        version = openmlpimp.__version__
+    fixed = '' if not fixed_parameters else ','.join('%s=%s' % (k, fixed_parameters[k]) for k in sorted(fixed_parameters))
+    ignored = '' if not ignore_parameters else ','.join(sorted(ignore_parameters))
+    return '%s|flow=%s|task=%s|fixed=%s|ignore=%s|version=%s' % (kind, flow_id, task_id, fixed, ignored, version)
+
+
+class ArtifactManifest(object):
+    """
+    Index of derived cache artifacts (stored as json), which maps an
+    artifact key to the files of the artifact, their size and last access.
+    Lookups only read the manifest (re-parsed when it changed) and check
+    that the files of the artifact exist; the access times are written in
+    batches (see flush). When the total size exceeds the quota, least
+    recently used artifacts are removed.
+
+    Parameters
+    -------
+    path : str
+        location of the manifest file
+
+    quota_bytes : int
+        disk quota for all registered artifacts together (None: unbounded)
+    """
+    def __init__(self, path, quota_bytes=None):
+        self.path = path
+        self.quota_bytes = quota_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = fasteners.InterProcessLock(path + '.lock')
+        # parsed manifest for lookups, with the stat of the file it was read from
+        self._entries = dict()
+        self._stamp = None
+        # access times of lookups, not written to the manifest yet
+        self._accessed = dict()
+        atexit.register(self.flush)
+
+    def _read(self):
+        if not os.path.isfile(self.path):
+            return dict()
+        with open(self.path) as fp:
+            return json.load(fp)
+
+    def _read_cached(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return dict()
+        stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if stamp != self._stamp:
+            self._entries = self._read()
+            self._stamp = stamp
+        return self._entries
+
+    def _read_for_update(self):
+        # (under the lock) the manifest, including the pending access times
+        entries = self._read()
+        for key, last_access in self._accessed.items():
+            if key in entries:
+                entries[key]['last_access'] = max(entries[key]['last_access'], last_access)
+        self._accessed = dict()
+        return entries
+
+    def _write(self, entries):
+        with openmlpimp.utils.atomic_write(self.path) as fp:
+            json.dump(entries, fp, indent=1, sort_keys=True)
+
+    def lookup(self, key):
+        """
+        Returns the list of files of the artifact (or None if the artifact is
+        not registered) and marks it as recently used. If some of the files
+        were deleted (outside of the manifest), the artifact is removed and
+        None is returned, so that the caller rebuilds it.
+        """
+        entry = self._read_cached().get(key)
+        if entry is None:
+            return None
+        if not all(os.path.isfile(path) for path in entry['files']):
+            self.remove(key)
+            return None
+        self._accessed[key] = time.time()
+        return entry['files']
+
+    def flush(self):
+        """
+        Writes the access times of the lookups since the last change to the
+        manifest (also done on every change, and at exit).
+        """
+        if len(self._accessed) == 0:
+            return
+        with self._lock:
+            self._write(self._read_for_update())
+
+    def register(self, key, files, protect=()):
+        """
+        Registers (or replaces) the artifact with the given files, which
+        should already exist. Evicts other artifacts if the quota is exceeded,
+        except for the keys in protect (e.g., artifacts that the caller is
+        still using); the quota might then be exceeded.
+        """
+        files = [os.path.abspath(path) for path in files]
+        with self._lock:
+            entries = self._read_for_update()
+            entries[key] = {'files': files,
+                            'size': sum(os.path.getsize(path) for path in files),
+                            'last_access': time.time()}
+            evicted = self._evict(entries, protect=set(protect) | {key})
+            self._write(entries)
+        return evicted
+
+    def remove(self, key):
+        with self._lock:
+            entries = self._read_for_update()
+            if key in entries:
+                self._remove_files(entries.pop(key))
+            self._write(entries)
+
+    def total_size(self):
+        return sum(entry['size'] for entry in self._read().values())
+
+    @staticmethod
+    def _remove_files(entry):
+        for path in entry['files']:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, entries, protect=()):
+        evicted = []
+        if self.quota_bytes is None:
+            return evicted
+        total = sum(entry['size'] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_access']):
+            if total <= self.quota_bytes:
+                break
+            if key in protect:
+                continue
+            total -= entries[key]['size']
+            self._remove_files(entries.pop(key))
+            evicted.append(key)
+        return evicted
@@ -0,0 +1,221 @@
+import json
+import openml
+import openmlcontrib
+import openmlpimp
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ConfigSpace.hyperparameters import CategoricalHyperparameter
+
+
+def _arff_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    value = str(value)
+    if any(char in value for char in ' ,{}\'"%\t'):
+        return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+    return value
+
+
+def _arff_header(config_space, measure, meta_data):
+    lines = ['% ' + json.dumps(meta_data),
+             '@RELATION openml-meta-flow-%d' % meta_data['flow_id'],
+             '']
+    for hyperparameter in config_space.get_hyperparameters():
+        if isinstance(hyperparameter, CategoricalHyperparameter):
+            attribute_type = '{' + ', '.join(_arff_value(choice) for choice in hyperparameter.choices) + '}'
+        else:
+            attribute_type = 'NUMERIC'
+        lines.append('@ATTRIBUTE %s %s' % (hyperparameter.name, attribute_type))
+    lines.append('@ATTRIBUTE %s NUMERIC' % measure)
+    lines.append('@ATTRIBUTE task_id NUMERIC')
+    lines.extend(['', '@DATA', ''])
+    return '\n'.join(lines)
+
+
+def _sidecar_path(output_path):
+    return output_path + '.tasks.json'
+
+
+def _write_sidecar(output_path, task_ids):
+    # records the completed tasks and the file size after their rows
+    with openmlpimp.utils.atomic_write(_sidecar_path(output_path)) as fp:
+        json.dump({'tasks': sorted(int(task_id) for task_id in task_ids),
+                   'size': os.path.getsize(output_path)}, fp)
+
+
+def _scan_existing(output_path, meta_data):
+    """
+    Returns the task ids that are already completely in the file, including
+    tasks without applicable runs, as recorded in the sidecar file (written
+    after each task). Rows after the recorded size (of an interrupted task)
+    are removed. Files without sidecar are scanned instead; the rows of the
+    last task are then removed, as writing them might have been
+    interrupted, and that task is exported again.
+    """
+    with open(output_path) as fp:
+        first_line = fp.readline()
+    existing_meta_data = json.loads(first_line[1:])
+    if existing_meta_data['col_parameters'] != meta_data['col_parameters']:
+        raise ValueError('Existing meta-dataset has other parameters: %s' % existing_meta_data['col_parameters'])
+
+    if os.path.isfile(_sidecar_path(output_path)):
+        with open(_sidecar_path(output_path)) as fp:
+            sidecar = json.load(fp)
+        with open(output_path, 'r+b') as fp:
+            fp.truncate(sidecar['size'])
+        return set(sidecar['tasks'])
+
+    completed = list()
+    last_task_start = None
+    in_data = False
+    offset = 0
+    with open(output_path, 'rb') as fp:
+        for line in fp:
+            if in_data and line.endswith(b'\n') and line.strip() and not line.startswith(b'%'):
+                task_id = int(float(line.rsplit(b',', 1)[1]))
+                if len(completed) == 0 or completed[-1] != task_id:
+                    completed.append(task_id)
+                    last_task_start = offset
+            elif line.strip().upper() == b'@DATA':
+                in_data = True
+            offset += len(line)
+        end = offset
+    if last_task_start is not None:
+        end = last_task_start
+        completed = completed[:-1]
+    with open(output_path, 'r+b') as fp:
+        fp.truncate(end)
+    return set(completed)
+
+
+def export_meta_dataset(output_path, flow_id, task_ids, config_space,
+                        measure='predictive_accuracy',
+                        study_id=None,
+                        num_runs=None,
+                        parameter_names=None,
+                        keyfield='parameter_name',
+                        n_workers=4):
+    """
+    Creates (or extends) an ARFF meta-dataset in the format of
+    KDD2018/data/arff, with one row per run: the hyperparameter values,
+    the measure and the task id. Evaluations and setups of different tasks
+    are obtained concurrently; rows are appended to the file per task, as
+    soon as the task is done. Tasks that are already in the file are
+    skipped; the completed tasks are recorded in a sidecar file
+    (output_path + '.tasks.json').
+
+    Parameters
+    -------
+    output_path : str
+        the ARFF file to create or extend
+
+    flow_id : int
+        the flow id of the classifier
+
+    task_ids : list[int]
+        the tasks to include
+
+    config_space : ConfigSpace.ConfigurationSpace
+        determines the hyperparameter columns. Runs with values outside of
+        the config space are left out
+
+    measure : str
+        the OpenML evaluation measure
+
+    study_id : str
+        recorded in the meta-data header
+
+    num_runs : int
+        maximum number of runs per task (None: all)
+
+    parameter_names : dict[str, str]
+        maps from hyperparameter name to the OpenML parameter name (the
+        keyfield of the setup parameters). By default, the last part of
+        the hyperparameter name (split on '__') is used
+
+    n_workers : int
+        number of tasks that are obtained concurrently
+
+    Returns
+    -------
+    num_rows : int
+        the number of rows that was added
+    """
+    hyperparameters = config_space.get_hyperparameters()
+    if parameter_names is None:
+        parameter_names = {hyperparameter.name: hyperparameter.name.split('__')[-1] for hyperparameter in hyperparameters}
+    meta_data = {'flow_id': flow_id,
+                 'openml_server': openml.config.server,
+                 'col_parameters': [hyperparameter.name for hyperparameter in hyperparameters],
+                 'col_measures': [measure],
+                 'normalized_y': False,
+                 'study_id': study_id,
+                 'num_runs': num_runs}
+
+    if os.path.isfile(output_path):
+        completed = _scan_existing(output_path, meta_data)
+    else:
+        completed = set()
+        with openmlpimp.utils.atomic_write(output_path) as fp:
+            fp.write(_arff_header(config_space, measure, meta_data))
+    _write_sidecar(output_path, completed)
+    remaining = [task_id for task_id in task_ids if task_id not in completed]
+    print('%s Tasks in meta-dataset: %d; to obtain: %d' % (openmlpimp.utils.get_time(), len(completed), len(remaining)))
+
+    known_setups = dict()
+    setups_lock = threading.Lock()
+
+    def obtain_setups(setup_ids):
+        with setups_lock:
+            missing = set(setup_ids) - set(known_setups.keys())
+        if len(missing) > 0:
+            setups = openmlpimp.utils.openml_call(openmlcontrib.setups.obtain_setups_by_ids, missing)
+            with setups_lock:
+                known_setups.update(setups)
+        with setups_lock:
+            return {setup_id: known_setups[setup_id] for setup_id in setup_ids if setup_id in known_setups}
+
+    def setup_to_row(setup):
+        values = {getattr(parameter, keyfield): parameter.value for parameter in setup.parameters.values()}
+        row = []
+        for hyperparameter in hyperparameters:
+            if parameter_names[hyperparameter.name] not in values:
+                return None
+            value = openmlpimp.utils.decode_config_value(values[parameter_names[hyperparameter.name]])
+            if isinstance(hyperparameter, CategoricalHyperparameter):
+                if value not in hyperparameter.choices:
+                    return None
+            elif not isinstance(value, (int, float)) or not hyperparameter.lower <= value <= hyperparameter.upper:
+                return None
+            row.append(_arff_value(value))
+        return row
+
+    def obtain_task_rows(task_id):
+        evaluations = openmlpimp.utils.openml_call(openml.evaluations.list_evaluations, function=measure,
+                                                   flow=[flow_id], task=[task_id], size=num_runs)
+        setups = obtain_setups({evaluation.setup_id for evaluation in evaluations.values()})
+        setup_rows = dict()
+        lines = []
+        for run_id in sorted(evaluations):
+            setup_id = evaluations[run_id].setup_id
+            if setup_id not in setup_rows:
+                setup_rows[setup_id] = setup_to_row(setups[setup_id]) if setup_id in setups else None
+            if setup_rows[setup_id] is None:
+                continue
+            lines.append(','.join(setup_rows[setup_id] + [_arff_value(float(evaluations[run_id].value)), str(task_id)]) + '\n')
+        return task_id, lines
+
+    num_rows = 0
+    with ThreadPoolExecutor(max_workers=n_workers) as executor, open(output_path, 'a') as fp:
+        futures = [executor.submit(obtain_task_rows, task_id) for task_id in remaining]
+        for future in as_completed(futures):
+            task_id, lines = future.result()
+            fp.write(''.join(lines))
+            fp.flush()
+            completed.add(task_id)
+            _write_sidecar(output_path, completed)
+            num_rows += len(lines)
+            print('%s Task %d: %d rows' % (openmlpimp.utils.get_time(), task_id, len(lines)))
+    return num_rows
@@ -20,9 +20,10 @@ def fixed_parameters_to_suffix(fixed_parameters):
 
 def do_run(task, optimizer, output_dir, internet_access=True, publish=False):
     if internet_access:
+        # trains the model locally; not an OpenML fetch, so not part of the call metrics
         run = openml.runs.run_model_on_task(task, optimizer)
         score = run.get_metric_fn(sklearn.metrics.accuracy_score)
-        print('%s [SCORE] Data: %s; Accuracy: %0.2f' % (openmlpimp.utils.get_time(), task.get_dataset().name, score.mean()))
+        print('%s [SCORE] Data: %s; Accuracy: %0.2f' % (openmlpimp.utils.get_time(), openmlpimp.utils.openml_call_uncached(task.get_dataset).name, score.mean()))
         if publish:
             run = run.publish()
 
@@ -46,7 +47,7 @@ def do_run(task, optimizer, output_dir, internet_access=True, publish=False):
         score = run.get_metric_fn(sklearn.metrics.accuracy_score)
 
         print('%s [SCORE] Data: %s; Accuracy: %0.2f' % (
-        openmlpimp.utils.get_time(), task.get_dataset().name, score.mean()))
+        openmlpimp.utils.get_time(), openmlpimp.utils.openml_call_uncached(task.get_dataset).name, score.mean()))
 
         if run.trace_content is not None:
             trace_arff = arff.dumps(run._generate_trace_arff_dict())
@@ -0,0 +1,221 @@
+import collections
+import contextlib
+import functools
+import openml
+import openmlcontrib
+import openmlpimp
+import os
+import pickle
+import random
+import threading
+import time
+
+from openml.exceptions import OpenMLServerException
+
+
+class SyntheticRunListing(object):
+    """
+    Local stand-in for openml.runs.list_runs. Generates a deterministic
+    listing of runs over a number of tasks and optionally sleeps for a fixed
+    latency per page, so that the (concurrent) listing code can be
+    benchmarked without a connection to the OpenML server.
+
+    Parameters
+    -------
+    num_runs : int
+        total number of runs in the listing
+
+    task_ids : list[int]
+        the task ids that the runs are distributed over
+
+    latency : float
+        seconds to sleep per requested page (simulates a round trip)
+
+    seed : int
+        random seed for assigning runs to tasks
+    """
+    def __init__(self, num_runs, task_ids, latency=0.0, seed=0):
+        rng = random.Random(seed)
+        self.num_runs = num_runs
+        self.latency = latency
+        self.run_tasks = [rng.choice(task_ids) for _ in range(num_runs)]
+        self.num_calls = 0
+
+    def __call__(self, size=None, offset=None, **kwargs):
+        self.num_calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        offset = 0 if offset is None else offset
+        end = self.num_runs if size is None else min(offset + size, self.num_runs)
+        if offset >= end:
+            raise OpenMLServerException('No results', 372)
+
+        runs = collections.OrderedDict()
+        for idx in range(offset, end):
+            run_id = idx + 1
+            runs[run_id] = {'run_id': run_id, 'task_id': self.run_tasks[idx], 'setup_id': 1, 'flow_id': None, 'uploader': 1}
+        return runs
+
+    def expected_task_counts(self):
+        return dict(collections.Counter(self.run_tasks))
+
+
+# the OpenML functions that the package (and examples) use to obtain data.
+# The methods that read the data files from the openml cache directory
+# (dataset contents, task splits) are recorded per dataset / task id, so
+# that replaying, e.g., run_model_on_task needs neither network nor files.
+DEFAULT_TARGETS = [
+    (openml.runs, 'list_runs'),
+    (openml.evaluations, 'list_evaluations'),
+    (openml.setups, 'list_setups'),
+    (openml.setups, 'get_setup'),
+    (openml.tasks, 'get_task'),
+    (openml.datasets, 'get_dataset'),
+    (openml.study, 'get_study'),
+    (openmlcontrib.setups, 'obtain_setups_by_ids'),
+    (openml.datasets.OpenMLDataset, 'get_data', 'dataset_id'),
+    (openml.tasks.OpenMLTask, 'download_split', 'task_id'),
+]
+
+
+class FixtureStore(object):
+    """
+    Directory with recorded OpenML responses, one pickle per call. Calls are
+    identified the same way as in the response cache (function and
+    arguments). Exceptions are recorded as well, so that, e.g., the 'no
+    results' error at the end of a paginated listing is replayed too.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def save(self, key, value=None, exception=None):
+        with openmlpimp.utils.atomic_write(self._path(key), 'wb') as fp:
+            pickle.dump((value, exception), fp, pickle.HIGHEST_PROTOCOL)
+
+    def load(self, key):
+        with open(self._path(key), 'rb') as fp:
+            return pickle.load(fp)
+
+
+def _call_key(original, args, kwargs, id_attribute):
+    if id_attribute is not None:
+        # method: the instance is identified by its id (e.g., the task id)
+        args = [getattr(args[0], id_attribute)] + list(args[1:])
+    return openmlpimp.utils.ResponseCache.key(original, args, kwargs)
+
+
+def _recording(original, store, id_attribute=None):
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        key = _call_key(original, args, kwargs, id_attribute)
+        try:
+            value = original(*args, **kwargs)
+        except OpenMLServerException as e:
+            store.save(key, exception=e)
+            raise
+        store.save(key, value=value)
+        return value
+    return wrapper
+
+
+def _replaying(original, store, latency, id_attribute=None):
+    # callable objects (e.g., SyntheticRunListing) have no __name__
+    name = getattr(original, '__name__', type(original).__name__)
+    if isinstance(latency, dict):
+        delay = latency.get(name, 0.0)
+    else:
+        delay = latency
+
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        key = _call_key(original, args, kwargs, id_attribute)
+        if key not in store:
+            raise ValueError('No recorded response for %s (args: %s, kwargs: %s) in %s' %
+                             (name, str(args), str(kwargs), store.directory))
+        if delay > 0:
+            time.sleep(delay)
+        value, exception = store.load(key)
+        if exception is not None:
+            raise exception
+        return value
+    return wrapper
+
+
+_install_lock = threading.Lock()
+
+
+def install(mode, directory, latency=0.0, targets=None):
+    """
+    Replaces the OpenML functions in targets by recording or replaying
+    stand-ins.
+
+    Parameters
+    -------
+    mode : str
+        'record' (call OpenML and store every response in directory) or
+        'replay' (serve the responses from directory, without network)
+
+    directory : str
+        the fixture directory
+
+    latency : float or dict[str, float]
+        replay only; seconds to sleep per call, either for all functions or
+        per function name (e.g., {'list_evaluations': 0.5})
+
+    targets : list[tuple]
+        the functions to replace, as (module, name), or (class, name,
+        id attribute) for methods (default: DEFAULT_TARGETS)
+
+    Returns
+    -------
+    uninstall : callable
+        restores the original functions
+    """
+    if mode not in ['record', 'replay']:
+        raise ValueError('Unknown mode: %s' % mode)
+    if targets is None:
+        targets = DEFAULT_TARGETS
+    store = FixtureStore(directory)
+
+    originals = []
+    with _install_lock:
+        for target in targets:
+            module, name = target[:2]
+            id_attribute = target[2] if len(target) > 2 else None
+            original = getattr(module, name)
+            if mode == 'record':
+                setattr(module, name, _recording(original, store, id_attribute))
+            else:
+                setattr(module, name, _replaying(original, store, latency, id_attribute))
+            originals.append((module, name, original))
+
+    def uninstall():
+        with _install_lock:
+            for module, name, original in reversed(originals):
+                setattr(module, name, original)
+    return uninstall
+
+
+@contextlib.contextmanager
+def record(directory, targets=None):
+    uninstall = install('record', directory, targets=targets)
+    try:
+        yield
+    finally:
+        uninstall()
+
+
+@contextlib.contextmanager
+def replay(directory, latency=0.0, targets=None):
+    uninstall = install('replay', directory, latency=latency, targets=targets)
+    try:
+        yield
+    finally:
+        uninstall()
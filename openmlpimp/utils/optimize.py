@@ -43,7 +43,7 @@ def obtain_runids(task_ids, flow_id, classifier, param_templates):
     for task_id in task_ids:
         print("task", task_id)
         try:
-            runs = openml.runs.list_runs(task=[task_id], flow=[flow_id])
+            runs = openmlpimp.utils.openml_call(openml.runs.list_runs, task=[task_id], flow=[flow_id])
         except:
             print("runs None")
             continue
@@ -53,7 +53,7 @@ def obtain_runids(task_ids, flow_id, classifier, param_templates):
             if setup_id not in setups:
                 # occurs when experiments are still running.
                 sys.stderr.write('setup not available. (should not happen!) %d' %setup_id)
-                setups[setup_id] = openml.setups.get_setup(setup_id)
+                setups[setup_id] = openmlpimp.utils.openml_call(openml.setups.get_setup, setup_id)
 
             paramname_paramidx = {param.parameter_name: idx for idx, param in setups[setup_id].parameters.items()}
 
@@ -43,7 +43,7 @@ def to_csv_file(ranks_dict, classifier, location):
     for task_id, params in ranks_dict.items():
         hyperparameters = set([openmlpimp.utils.name_mapping(classifier, param) for param in params.keys()])
 
-    with open(location, 'w') as csvfile:
+    with openmlpimp.utils.atomic_write(location) as csvfile:
         fieldnames = ['task_id']
         fieldnames.extend(hyperparameters)
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -57,7 +57,7 @@ def to_csv_file(ranks_dict, classifier, location):
 
 
 def to_csv_unpivot(ranks_dict, classifier, location):
-    with open(location, 'w') as csvfile:
+    with openmlpimp.utils.atomic_write(location) as csvfile:
         fieldnames = ['task_id', 'param_id', 'param_name', 'variance_contribution']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
@@ -0,0 +1,95 @@
+import collections
+import openml
+import openmlpimp
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+PrefetchedTask = collections.namedtuple('PrefetchedTask', ['task_id', 'task', 'dataset'])
+
+
+def _load_task(task_id, load_splits, load_data):
+    task = openmlpimp.utils.openml_call_uncached(openml.tasks.get_task, task_id)
+    dataset = openmlpimp.utils.openml_call_uncached(task.get_dataset)
+    if load_splits:
+        openmlpimp.utils.openml_call_uncached(task.download_split)
+    if load_data:
+        # fills the local (pickle) cache of the data
+        dataset.get_data()
+    return PrefetchedTask(task_id, task, dataset)
+
+
+class TaskPrefetcher(object):
+    """
+    Iterates over OpenML tasks, while the next tasks (metadata, dataset
+    and splits) are loaded in background threads. Tasks are handed out in
+    the order of task_ids, through a bounded queue.
+
+    Parameters
+    -------
+    task_ids : list[int]
+        the tasks to load
+
+    depth : int
+        number of tasks that are loaded ahead of the one that is handed out
+
+    n_workers : int
+        number of loading threads (default: depth)
+
+    load_splits : bool
+        whether to download the estimation procedure splits
+
+    load_data : bool
+        whether to also load the data of the dataset
+
+    Usage
+    -------
+    for prefetched in TaskPrefetcher(task_ids, depth=2):
+        prefetched.task, prefetched.dataset ...
+    """
+    def __init__(self, task_ids, depth=2, n_workers=None, load_splits=True, load_data=False):
+        if depth < 1:
+            raise ValueError('depth should be at least 1')
+        self.task_ids = list(task_ids)
+        self.depth = depth
+        self.n_workers = n_workers if n_workers is not None else depth
+        self.load_splits = load_splits
+        self.load_data = load_data
+
+    def __len__(self):
+        return len(self.task_ids)
+
+    def __iter__(self):
+        executor = ThreadPoolExecutor(max_workers=self.n_workers)
+        futures = queue.Queue(maxsize=self.depth)
+        slots = threading.Semaphore(self.depth)
+        stop = threading.Event()
+
+        def produce():
+            for task_id in self.task_ids:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                futures.put(executor.submit(_load_task, task_id, self.load_splits, self.load_data))
+            futures.put(None)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                future = futures.get()
+                if future is None:
+                    break
+                # this task is no longer ahead; allow loading the next one
+                slots.release()
+                yield future.result()
+        finally:
+            stop.set()
+            slots.release()
+            while not futures.empty():
+                future = futures.get_nowait()
+                if future is not None:
+                    future.cancel()
+            executor.shutdown(wait=False)
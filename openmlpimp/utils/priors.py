@@ -9,6 +9,8 @@ import os
 import pickle
 import warnings
 
+from concurrent.futures import ThreadPoolExecutor
+
 from sklearn.neighbors import KernelDensity
 from scipy.stats import gaussian_kde, rv_discrete, uniform, randint
 from ConfigSpace.hyperparameters import CategoricalHyperparameter, NumericalHyperparameter, UniformFloatHyperparameter, UniformIntegerHyperparameter
@@ -136,28 +138,112 @@ def cache_setups(cache_directory, flow_id, bestN):
     except FileExistsError:
         pass
 
-    setups = openml.setups.list_setups(flow=flow_id)
+    setups = openmlpimp.utils.openml_call(openml.setups.list_setups, flow=flow_id)
     with open(cache_directory + '/setup_list_best%d.pkl' %bestN, 'wb') as f:
         pickle.dump(setups, f, pickle.HIGHEST_PROTOCOL)
 
 
+def _store_task_setup_scores(cache_directory, task_setup_scores, watermarks):
+    # the scores are written before the watermarks; when interrupted in
+    # between, the next refresh merely obtains some evaluations twice
+    with openmlpimp.utils.atomic_write(cache_directory + '/best_setup_per_task.pkl', 'wb') as f:
+        pickle.dump(task_setup_scores, f, pickle.HIGHEST_PROTOCOL)
+    with openmlpimp.utils.atomic_write(cache_directory + '/best_setup_per_task_watermarks.json') as f:
+        json.dump({str(task_id): mark for task_id, mark in watermarks.items()}, f)
+
+
 def cache_task_setup_scores(cache_directory, study, flow_id):
     # print(setups.keys())
     task_setup_scores = collections.defaultdict(dict)
+    watermarks = dict()
     for task_id in study.tasks:
-        runs = openml.evaluations.list_evaluations("predictive_accuracy", task=[task_id], flow=[flow_id])
+        runs = openmlpimp.utils.openml_call(openml.evaluations.list_evaluations, "predictive_accuracy", task=[task_id], flow=[flow_id])
         for run in runs.values():
             task_setup_scores[task_id][run.setup_id] = run.value
+        watermarks[task_id] = {'max_run_id': max(runs.keys()) if len(runs) > 0 else -1, 'num_evaluations': len(runs)}
     try:
         os.makedirs(cache_directory)
     except FileExistsError:
         pass
 
-    with open(cache_directory + '/best_setup_per_task.pkl', 'wb') as f:
-        pickle.dump(task_setup_scores, f, pickle.HIGHEST_PROTOCOL)
+    _store_task_setup_scores(cache_directory, task_setup_scores, watermarks)
+    return task_setup_scores
+
+
+def _obtain_new_evaluations(task_id, flow_id, watermark, overlap, batch_size):
+    # assumes that the server lists evaluations in order of run id. To be
+    # robust against removed runs, a bit before the previous end is re-read
+    offset = max(0, watermark['num_evaluations'] - overlap)
+    new_evaluations = dict()
+    num_listed = offset
+    for page in openmlpimp.utils.list_paginated(openml.evaluations.list_evaluations, batch_size=batch_size, n_workers=1,
+                                                offset=offset, use_cache=False, function="predictive_accuracy",
+                                                task=[task_id], flow=[flow_id]):
+        num_listed += len(page)
+        for run_id, evaluation in page.items():
+            if run_id > watermark['max_run_id']:
+                new_evaluations[run_id] = evaluation
+    return new_evaluations, num_listed
+
+
+def refresh_task_setup_scores(cache_directory, study, flow_id, n_workers=8, overlap=100, batch_size=10000):
+    """
+    Updates the task setup scores cache (best_setup_per_task.pkl) with
+    evaluations that were uploaded since it was created or last refreshed.
+    Per task, the highest run id that is already in the cache is
+    remembered, and only evaluations beyond it are merged in.
+
+    Parameters
+    -------
+    cache_directory : str
+        the directory that contains the cache
+
+    study : OpenMLStudy
+        the study (including tasks) that the cache is based on
+
+    flow_id : int
+        the flow id of the classifier
 
+    n_workers : int
+        number of tasks that are refreshed concurrently
+
+    Returns
+    -------
+    num_new : int
+        the number of evaluations that was added
+    """
+    priors_cache_file = cache_directory + '/best_setup_per_task.pkl'
+    watermarks_file = cache_directory + '/best_setup_per_task_watermarks.json'
+    if not os.path.isfile(priors_cache_file):
+        task_setup_scores = cache_task_setup_scores(cache_directory, study, flow_id)
+        return sum(len(setup_scores) for setup_scores in task_setup_scores.values())
 
-def obtain_priors(cache_directory, study_id, flow_id, config_space, fixed_parameters, holdout, bestN):
+    with open(priors_cache_file, 'rb') as f:
+        task_setup_scores = pickle.load(f)
+    watermarks = dict()
+    if os.path.isfile(watermarks_file):
+        with open(watermarks_file) as f:
+            watermarks = {int(task_id): mark for task_id, mark in json.load(f).items()}
+
+    def refresh(task_id):
+        # tasks without a watermark (e.g., caches from before watermarks were kept) are read completely
+        watermark = watermarks.get(task_id, {'max_run_id': -1, 'num_evaluations': 0})
+        return task_id, watermark, _obtain_new_evaluations(task_id, flow_id, watermark, overlap, batch_size)
+
+    num_new = 0
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for task_id, watermark, (new_evaluations, num_listed) in executor.map(refresh, study.tasks):
+            for run_id in sorted(new_evaluations):
+                task_setup_scores.setdefault(task_id, dict())[new_evaluations[run_id].setup_id] = new_evaluations[run_id].value
+            max_run_id = max([watermark['max_run_id']] + list(new_evaluations.keys()))
+            watermarks[task_id] = {'max_run_id': max_run_id, 'num_evaluations': num_listed}
+            num_new += len(new_evaluations)
+
+    _store_task_setup_scores(cache_directory, task_setup_scores, watermarks)
+    return num_new
+
+
+def obtain_priors(cache_directory, study_id, flow_id, config_space, fixed_parameters, holdout, bestN, refresh=False, manifest=None):
     """
     Obtains the priors based on (almost) all tasks in an OpenML study
 
@@ -185,6 +271,14 @@ def obtain_priors(cache_directory, study_id, flow_id, config_space, fixed_parame
     bestN : int
         from each task, take the N best setups.
 
+    refresh : bool
+        if the task setup scores are already cached, merge in the
+        evaluations that were uploaded since (see refresh_task_setup_scores)
+
+    manifest : ArtifactManifest
+        if given, the cache files are looked up in and registered with this
+        manifest (instead of probing the filesystem)
+
     Returns
     -------
     X : dict[str, list[mixed]]
@@ -193,11 +287,23 @@ def obtain_priors(cache_directory, study_id, flow_id, config_space, fixed_parame
     priors_cache_file = cache_directory + '/best_setup_per_task.pkl'
     setups_cache_file = cache_directory + '/setup_list_best%d.pkl' % bestN
 
-    if not os.path.isfile(setups_cache_file):
+    # the files are shared by other calls (other bestN, fixed parameters), so
+    # they are registered as separate artifacts
+    setups_registered = scores_registered = False
+    if manifest is not None:
+        setups_key = openmlpimp.utils.artifact_key('setups_best%d' % bestN, flow_id)
+        scores_key = openmlpimp.utils.artifact_key('task_setup_scores_%s' % study_id, flow_id)
+        setups_registered = manifest.lookup(setups_key) is not None
+        scores_registered = manifest.lookup(scores_key) is not None
+
+    if not setups_registered and not os.path.isfile(setups_cache_file):
         print('%s No cache file for setups (expected: %s), will create one ... ' %(openmlpimp.utils.get_time(), setups_cache_file))
         cache_setups(cache_directory, flow_id, bestN)
         print('%s Cache created. Available in: %s' %(openmlpimp.utils.get_time(), setups_cache_file))
 
+    if manifest is not None and not setups_registered:
+        manifest.register(setups_key, [setups_cache_file])
+
     with open(setups_cache_file, 'rb') as f:
         setups = pickle.load(f)
         setups = openmlcontrib.setups.filter_setup_list_by_config_space(setups, config_space)
@@ -205,11 +311,18 @@ def obtain_priors(cache_directory, study_id, flow_id, config_space, fixed_parame
             for param_name, param_value in fixed_parameters.items():
                 setups = openmlcontrib.setups.filter_setup_list(setups, param_name, allowed_values=[param_value])
 
-    if not os.path.isfile(priors_cache_file):
+    if not scores_registered and not os.path.isfile(priors_cache_file):
         print('%s No cache file for task setup scores (expected: %s), will create one ... ' % (openmlpimp.utils.get_time(), priors_cache_file))
-        study = openml.study.get_study(study_id, 'tasks')
+        study = openmlpimp.utils.openml_call_uncached(openml.study.get_study, study_id, 'tasks')
         cache_task_setup_scores(cache_directory, study, flow_id)
         print('%s Cache created. Available in: %s' % (openmlpimp.utils.get_time(), priors_cache_file))
+    elif refresh:
+        study = openmlpimp.utils.openml_call_uncached(openml.study.get_study, study_id, 'tasks')
+        num_new = refresh_task_setup_scores(cache_directory, study, flow_id)
+        print('%s Refreshed cache with %d new evaluations: %s' % (openmlpimp.utils.get_time(), num_new, priors_cache_file))
+
+    if manifest is not None and (not scores_registered or refresh):
+        manifest.register(scores_key, [priors_cache_file], protect=[setups_key])
 
     with open(priors_cache_file, 'rb') as f:
         task_setup_scores = pickle.load(f)
@@ -252,8 +365,8 @@ def obtain_priors(cache_directory, study_id, flow_id, config_space, fixed_parame
     return X
 
 
-def get_kde_paramgrid(cache_directory, study_id, flow_id, config_space, fixed_parameters, holdout=None, bestN=1, oob_strategy='resample'):
-    priors = obtain_priors(cache_directory, study_id, flow_id, config_space, fixed_parameters, holdout, bestN)
+def get_kde_paramgrid(cache_directory, study_id, flow_id, config_space, fixed_parameters, holdout=None, bestN=1, oob_strategy='resample', refresh=False, manifest=None):
+    priors = obtain_priors(cache_directory, study_id, flow_id, config_space, fixed_parameters, holdout, bestN, refresh, manifest)
     param_grid = dict()
 
     for parameter_name, prior in priors.items():
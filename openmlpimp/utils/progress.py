@@ -0,0 +1,69 @@
+import fasteners
+import json
+import openmlpimp
+import os
+import time
+
+
+class StudyProgress(object):
+    """
+    Records (as json) which tasks of a study run are completed and where
+    their results are, so that an interrupted run can be resumed in the
+    same folder, skipping the completed tasks.
+
+    Parameters
+    -------
+    path : str
+        location of the progress file
+
+    settings : dict
+        the settings of the run (json serializable). Resuming a run that was
+        started with other settings raises a ValueError
+    """
+    def __init__(self, path, settings=None):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = fasteners.InterProcessLock(path + '.lock')
+        settings = json.loads(json.dumps(settings))
+        with self._lock:
+            progress = self._read()
+            if progress is None:
+                self._write({'settings': settings, 'tasks': dict()})
+            elif progress['settings'] != settings:
+                raise ValueError('Run in %s was started with other settings: %s' % (path, progress['settings']))
+
+    def _read(self):
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path) as fp:
+            return json.load(fp)
+
+    def _write(self, progress):
+        with openmlpimp.utils.atomic_write(self.path) as fp:
+            json.dump(progress, fp, indent=1, sort_keys=True)
+
+    def _update(self, task_id, entry):
+        with self._lock:
+            progress = self._read()
+            entry['time'] = time.time()
+            progress['tasks'][str(task_id)] = entry
+            self._write(progress)
+
+    def completed(self):
+        """
+        Returns
+        -------
+        completed : dict[int, str]
+            maps from task id to the results file of completed tasks
+        """
+        tasks = self._read()['tasks']
+        return {int(task_id): entry['results_file'] for task_id, entry in tasks.items() if entry['status'] == 'completed'}
+
+    def is_completed(self, task_id):
+        return task_id in self.completed()
+
+    def mark_completed(self, task_id, results_file):
+        self._update(task_id, {'status': 'completed', 'results_file': os.path.abspath(results_file)})
+
+    def mark_failed(self, task_id, message):
+        self._update(task_id, {'status': 'failed', 'message': message})
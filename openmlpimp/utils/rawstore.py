@@ -0,0 +1,106 @@
+import fasteners
+import openml
+import openmlcontrib
+import openmlpimp
+import os
+import pickle
+
+
+class RawEvaluationStore(object):
+    """
+    Stores the unfiltered evaluations (per flow, measure and task) and
+    setups (per flow, shared by all tasks) as obtained from OpenML. All
+    filtering (fixed parameters, ignored parameters, config space
+    projection) is done locally on what is read from the store, so changing
+    those settings does not require new calls to OpenML.
+
+    Layout: <directory>/<flow_id>/evaluations/<measure>/<task_id>.pkl and
+    <directory>/<flow_id>/setups.pkl
+
+    Parameters
+    -------
+    directory : str
+        a directory on the filesystem to store the raw data in
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._setups = dict()
+
+    def _flow_directory(self, flow_id):
+        return os.path.join(self.directory, str(flow_id))
+
+    def _evaluations_path(self, flow_id, task_id, function):
+        return os.path.join(self._flow_directory(flow_id), 'evaluations', function, '%d.pkl' % task_id)
+
+    def _setups_path(self, flow_id):
+        return os.path.join(self._flow_directory(flow_id), 'setups.pkl')
+
+    def _lock(self, flow_id):
+        os.makedirs(self._flow_directory(flow_id), exist_ok=True)
+        return fasteners.InterProcessLock(os.path.join(self._flow_directory(flow_id), 'store.lock'))
+
+    @staticmethod
+    def _load(path):
+        with open(path, 'rb') as fp:
+            return pickle.load(fp)
+
+    @staticmethod
+    def _store(path, value):
+        with openmlpimp.utils.atomic_write(path, 'wb') as fp:
+            pickle.dump(value, fp, pickle.HIGHEST_PROTOCOL)
+
+    def get_evaluations(self, flow_id, task_ids, function='predictive_accuracy', tasks_per_call=50):
+        """
+        Returns the evaluations of the flow on the tasks. Tasks that are not
+        in the store yet are obtained from OpenML (together) and stored.
+
+        Returns
+        -------
+        result : dict[int, dict[int, OpenMLEvaluation]]
+            maps from task id to a dict mapping from run id to evaluation
+        """
+        result = dict()
+        missing = [task_id for task_id in task_ids if not os.path.isfile(self._evaluations_path(flow_id, task_id, function))]
+        if len(missing) > 0:
+            with self._lock(flow_id):
+                # other processes might have obtained them in the meantime
+                missing = [task_id for task_id in missing if not os.path.isfile(self._evaluations_path(flow_id, task_id, function))]
+                for start in range(0, len(missing), tasks_per_call):
+                    batch = missing[start:start + tasks_per_call]
+                    evaluations = openmlpimp.utils.openml_call(openml.evaluations.list_evaluations, function=function,
+                                                               flow=[flow_id], task=batch)
+                    task_evaluations = {task_id: dict() for task_id in batch}
+                    for run_id, evaluation in evaluations.items():
+                        task_evaluations[evaluation.task_id][run_id] = evaluation
+                    for task_id, current in task_evaluations.items():
+                        self._store(self._evaluations_path(flow_id, task_id, function), current)
+                        result[task_id] = current
+
+        for task_id in task_ids:
+            if task_id not in result:
+                result[task_id] = self._load(self._evaluations_path(flow_id, task_id, function))
+        return result
+
+    def get_setups(self, flow_id, setup_ids):
+        """
+        Returns the (unfiltered) setups with the given ids. Setups that are
+        not in the store yet are obtained from OpenML and added.
+
+        Returns
+        -------
+        setups : dict[int, OpenMLSetup]
+        """
+        setup_ids = set(setup_ids)
+        known = self._setups.setdefault(flow_id, dict())
+        if not setup_ids.issubset(known.keys()) and os.path.isfile(self._setups_path(flow_id)):
+            known.update(self._load(self._setups_path(flow_id)))
+
+        if not setup_ids.issubset(known.keys()):
+            with self._lock(flow_id):
+                if os.path.isfile(self._setups_path(flow_id)):
+                    known.update(self._load(self._setups_path(flow_id)))
+                missing = setup_ids - set(known.keys())
+                if len(missing) > 0:
+                    known.update(openmlpimp.utils.openml_call(openmlcontrib.setups.obtain_setups_by_ids, missing))
+                    self._store(self._setups_path(flow_id), known)
+        return {setup_id: known[setup_id] for setup_id in setup_ids if setup_id in known}
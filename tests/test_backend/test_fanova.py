@@ -0,0 +1,173 @@
+import ConfigSpace
+import itertools
+import numpy as np
+import os
+import tempfile
+import unittest
+
+from openmlpimp.backend.fanova import train_evaluator, save_variance_tables, interaction_importances, \
+    quantize_runs
+
+
+def _problem():
+    config_space = ConfigSpace.ConfigurationSpace()
+    for name in ['x0', 'x1', 'x2']:
+        config_space.add_hyperparameter(ConfigSpace.UniformFloatHyperparameter(name, 0.0, 1.0))
+    rng = np.random.RandomState(1)
+    X = rng.uniform(size=(200, 3))
+    y = X[:, 0] + 0.5 * X[:, 1] * X[:, 2] + 0.1 * rng.normal(size=200)
+    return X, y, config_space
+
+
+class VarianceCacheTest(unittest.TestCase):
+
+    def test_reload(self):
+        X, y, config_space = _problem()
+        directory = tempfile.mkdtemp()
+
+        evaluator = train_evaluator(X, y, config_space, 8, seed=1, cache_directory=directory)
+        expected = evaluator.quantify_importance((0, 1, 2))
+        save_variance_tables(evaluator)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+        reloaded = train_evaluator(X, y, config_space, 8, seed=1, cache_directory=directory)
+        # the variance tables are restored, not recomputed
+        self.assertIn((1, 2), reloaded.V_U_total)
+        self.assertEqual(reloaded.quantify_importance((0, 1, 2)), expected)
+
+    def test_other_cutoffs_not_stored(self):
+        X, y, config_space = _problem()
+        directory = tempfile.mkdtemp()
+
+        evaluator = train_evaluator(X, y, config_space, 8, seed=1, cache_directory=directory)
+        evaluator.set_cutoffs((np.percentile(y, 25), np.inf))
+        evaluator.quantify_importance((0, 1))
+        save_variance_tables(evaluator)
+        self.assertEqual(os.listdir(directory), [])
+
+
+class SaveMarginalsTest(unittest.TestCase):
+
+    def test_new_directory(self):
+        from openmlpimp.backend.marginals import save_marginals
+        X, y, config_space = _problem()
+        evaluator = train_evaluator(X, y, config_space, 4, seed=1)
+        directory = os.path.join(tempfile.mkdtemp(), 'fanova', 'new')
+
+        path = save_marginals(evaluator, config_space, directory, pairs=[('x1', 'x2')], resolution=10,
+                              pairwise_resolution=5)
+        self.assertTrue(os.path.isfile(path))
+        with np.load(path) as arrays:
+            self.assertEqual(arrays['x0/mean'].shape, (10,))
+            self.assertEqual(arrays['x1__x2/z'].shape, (5, 5))
+
+    def test_render_failures(self):
+        from openmlpimp.backend.marginals import render_in_background, wait_for_renders
+        missing = os.path.join(tempfile.mkdtemp(), 'marginals.npz')
+        render_in_background(missing)
+        failures = wait_for_renders()
+        self.assertEqual(list(failures), [missing])
+        self.assertIsInstance(failures[missing], FileNotFoundError)
+        self.assertEqual(wait_for_renders(), dict())
+
+
+class _AdditiveEvaluator(object):
+    """
+    Stands in for a trained evaluator: the total importance of a subset is
+    the sum of the given components of all its (non-empty) subsets.
+    """
+    def __init__(self, components):
+        self.components = components
+        self.quantified = []
+        self.V_U_total = dict()
+        self.V_U_individual = dict()
+
+    def quantify_importance(self, dims):
+        self.quantified.append(dims)
+        result = dict()
+        for order in range(1, len(dims) + 1):
+            for sub_dims in itertools.combinations(dims, order):
+                total = sum(self.components.get(lower, 0.0) for lower_order in range(1, order + 1)
+                            for lower in itertools.combinations(sub_dims, lower_order))
+                self.V_U_total[sub_dims] = [total]
+                self.V_U_individual[sub_dims] = [self.components.get(sub_dims, 0.0)]
+                result[sub_dims] = {'total importance': total}
+        return result
+
+
+class InteractionImportancesTest(unittest.TestCase):
+
+    components = {(0,): 0.4, (1,): 0.2, (2,): 0.05, (3,): 0.01, (0, 1): 0.1, (1, 2): 0.02}
+
+    def test_all_combinations(self):
+        evaluator = _AdditiveEvaluator(self.components)
+        importances = interaction_importances(evaluator, 4, 3)
+        self.assertEqual(len(importances), 4 + 6 + 4)
+        for subset, importance in importances.items():
+            self.assertAlmostEqual(importance, self.components.get(subset, 0.0))
+
+    def test_threshold(self):
+        evaluator = _AdditiveEvaluator(self.components)
+        importances = interaction_importances(evaluator, 4, 3, threshold=0.1)
+        # only the pair of the two kept hyperparameters is expanded
+        self.assertEqual(sorted(importances), [(0,), (0, 1), (1,), (2,), (3,)])
+        self.assertAlmostEqual(importances[(0, 1)], 0.1)
+        self.assertNotIn((1, 2), evaluator.quantified)
+
+    def test_beam_width(self):
+        evaluator = _AdditiveEvaluator(self.components)
+        importances = interaction_importances(evaluator, 4, 3, beam_width=2)
+        self.assertEqual(sorted(importances), [(0,), (0, 1), (1,), (2,), (3,)])
+
+        evaluator = _AdditiveEvaluator(self.components)
+        importances = interaction_importances(evaluator, 4, 3, beam_width=1)
+        self.assertEqual(sorted(importances), [(0,), (1,), (2,), (3,)])
+
+    def test_processes(self):
+        expected = interaction_importances(_AdditiveEvaluator(self.components), 4, 2)
+        evaluator = _AdditiveEvaluator(self.components)
+        importances = interaction_importances(evaluator, 4, 2, n_jobs=2)
+        self.assertEqual(sorted(importances), sorted(expected))
+        for subset, importance in expected.items():
+            self.assertAlmostEqual(importances[subset], importance)
+        # the tables of the workers are merged into the evaluator
+        self.assertIn((2, 3), evaluator.V_U_total)
+
+
+class QuantizeRunsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_space = ConfigSpace.ConfigurationSpace()
+        self.config_space.add_hyperparameter(ConfigSpace.UniformFloatHyperparameter('a_x', 0.0, 1.0))
+        self.config_space.add_hyperparameter(ConfigSpace.UniformFloatHyperparameter('b_lr', 1e-4, 1.0, log=True))
+        self.config_space.add_hyperparameter(ConfigSpace.UniformIntegerHyperparameter('c_depth', 1, 10))
+        self.config_space.add_hyperparameter(ConfigSpace.CategoricalHyperparameter('d_kernel', ['rbf', 'poly']))
+
+    def test_bin_centers(self):
+        X = np.array([[0.1, 2e-4, 2, 0],
+                      [0.9, 0.5, 9, 1],
+                      [1.0, 1.0, 10, 1]])
+        X_quantized, y_mean, counts = quantize_runs(X, np.array([0.5, 0.7, 0.9]), self.config_space, 2)
+        np.testing.assert_allclose(X_quantized, [[0.25, 1e-3, 3, 0],
+                                                 [0.75, 1e-1, 8, 1]])
+        np.testing.assert_allclose(y_mean, [0.5, 0.8])
+        np.testing.assert_array_equal(counts, [1, 2])
+
+    def test_aggregate(self):
+        X = np.array([[0.1, 1e-4, 1, 0],
+                      [0.2, 2e-4, 2, 0],
+                      [0.3, 3e-4, 3, 1],
+                      [0.4, 4e-4, 4, 0]])
+        y = np.array([0.1, 0.2, 0.3, 0.6])
+        X_quantized, y_mean, counts = quantize_runs(X, y, self.config_space, 2)
+        # the categorical column still separates the runs
+        np.testing.assert_array_equal(X_quantized[:, 3], [0, 1])
+        np.testing.assert_allclose(y_mean, [0.3, 0.3])
+        np.testing.assert_array_equal(counts, [3, 1])
+        self.assertEqual(counts.sum(), len(y))
+
+    def test_levels(self):
+        X = np.array([[value, 1e-2, 5, 0] for value in np.linspace(0, 1, 50)])
+        X_quantized, _, counts = quantize_runs(X, np.zeros(50), self.config_space, 5)
+        np.testing.assert_allclose(X_quantized[:, 0], [0.1, 0.3, 0.5, 0.7, 0.9])
+        np.testing.assert_array_equal(counts, [10] * 5)
@@ -0,0 +1,50 @@
+import openmlpimp
+import os
+import tempfile
+import time
+import unittest
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.num_calls = 0
+
+    def tearDown(self):
+        openmlpimp.utils.set_response_cache(None)
+
+    def _listing(self, task, flow):
+        self.num_calls += 1
+        return {run_id: task for run_id in range(100)}
+
+    def test_cached_call(self):
+        openmlpimp.utils.set_response_cache(self.directory)
+        first = openmlpimp.utils.cached_call(self._listing, task={3, 6, 11}, flow=[6969])
+        second = openmlpimp.utils.cached_call(self._listing, task={11, 6, 3}, flow=[6969])
+        self.assertEqual(first, second)
+        self.assertEqual(self.num_calls, 1)
+
+        openmlpimp.utils.cached_call(self._listing, task={3}, flow=[6969])
+        self.assertEqual(self.num_calls, 2)
+
+    def test_ttl(self):
+        openmlpimp.utils.set_response_cache(self.directory, ttl=0.05)
+        openmlpimp.utils.cached_call(self._listing, task=[3], flow=[6969])
+        time.sleep(0.1)
+        openmlpimp.utils.cached_call(self._listing, task=[3], flow=[6969])
+        self.assertEqual(self.num_calls, 2)
+
+    def test_lru_eviction(self):
+        cache = openmlpimp.utils.ResponseCache(self.directory)
+        for idx in range(3):
+            cache.put('key%d' % idx, list(range(1000)))
+            os.utime(cache._path('key%d' % idx), (idx, idx))
+        entry_size = cache.entries()[0][1]
+
+        cache.get('key0')  # key1 is now least recently used
+        cache.max_bytes = entry_size * 2
+        cache.evict()
+        self.assertTrue(cache.get('key0')[0])
+        self.assertFalse(cache.get('key1')[0])
+        self.assertTrue(cache.get('key2')[0])
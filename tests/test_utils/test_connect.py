@@ -0,0 +1,118 @@
+import collections
+import ConfigSpace
+import json
+import openml
+import openmlpimp
+import os
+import tempfile
+import types
+import unittest
+
+from openml.exceptions import OpenMLServerException
+from unittest import mock
+
+
+class TaskCountsTest(unittest.TestCase):
+
+    def test_task_counts_offline(self):
+        listing = openmlpimp.utils.SyntheticRunListing(25, task_ids=[3, 6, 11, 12])
+        expected = listing.expected_task_counts()
+
+        for n_workers in [1, 3, 8]:
+            counts = openmlpimp.utils.task_counts(1, batch_size=10, n_workers=n_workers, listing_fn=listing)
+            self.assertEqual(counts, expected)
+
+    def test_task_counts_exact_page_boundary(self):
+        # the last page is full, so the paginator should stop on the empty one
+        listing = openmlpimp.utils.SyntheticRunListing(30, task_ids=[3, 6])
+        counts = openmlpimp.utils.task_counts(1, batch_size=10, n_workers=2, listing_fn=listing)
+        self.assertEqual(counts, listing.expected_task_counts())
+        self.assertEqual(sum(counts.values()), 30)
+
+
+class CachePathsTest(unittest.TestCase):
+
+    def test_settings_in_cache_path(self):
+        from openmlpimp.utils.connect import _cache_paths
+        fixed = {'kernel': 'rbf'}
+        base = _cache_paths('/tmp/cache/3', fixed, ['verbose'], 100)
+        self.assertEqual(base, _cache_paths('/tmp/cache/3', fixed, {'verbose'}, 100))
+        others = [_cache_paths('/tmp/cache/3', fixed, ['verbose', 'random_state'], 100),
+                  _cache_paths('/tmp/cache/3', fixed, None, 100),
+                  _cache_paths('/tmp/cache/3', fixed, ['verbose'], 200),
+                  _cache_paths('/tmp/cache/3', fixed, ['verbose'], 100, reverse=True)]
+        for paths in others:
+            self.assertNotEqual(paths[0], base[0])
+            self.assertNotEqual(paths[1], base[1])
+
+
+class StreamRunhistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_space = ConfigSpace.ConfigurationSpace()
+        self.config_space.add_hyperparameter(ConfigSpace.UniformFloatHyperparameter('C', 0.01, 100.0))
+        self.config_space.add_hyperparameter(ConfigSpace.UniformFloatHyperparameter('gamma', 0.001, 1.0))
+        # setups 7 and 8 are outside of the config space
+        self.setups = dict()
+        for setup_id in range(1, 9):
+            values = {1: ('C', 0.5 * setup_id if setup_id < 7 else 1000.0), 2: ('gamma', 0.1), 3: ('verbose', 0)}
+            parameters = {param_id: types.SimpleNamespace(parameter_name=name, value=value)
+                          for param_id, (name, value) in values.items()}
+            self.setups[setup_id] = types.SimpleNamespace(setup_id=setup_id, parameters=parameters)
+        self.evaluations = collections.OrderedDict()
+        for run_id in range(1, 26):
+            setup_id = run_id % 8 + 1
+            self.evaluations[run_id] = types.SimpleNamespace(run_id=run_id, setup_id=setup_id, value=0.5 + 0.01 * run_id)
+
+    def _list_evaluations(self, function, flow, task, size=None, offset=None):
+        run_ids = list(self.evaluations)[offset:offset + size]
+        if len(run_ids) == 0:
+            raise OpenMLServerException('No results', 372)
+        return collections.OrderedDict((run_id, self.evaluations[run_id]) for run_id in run_ids)
+
+    def _obtain_setups(self, setup_ids):
+        return {setup_id: self.setups[setup_id] for setup_id in setup_ids}
+
+    def _in_config_space(self, setup, config_space):
+        for parameter in setup.parameters.values():
+            if parameter.parameter_name in config_space:
+                hyperparameter = config_space.get_hyperparameter(parameter.parameter_name)
+                if not hyperparameter.lower <= parameter.value <= hyperparameter.upper:
+                    return False
+        return True
+
+    def _stream(self, runhistory_path, **kwargs):
+        from openmlpimp.utils.connect import stream_runhistory_to_file
+        with mock.patch('openmlpimp.utils.connect._obtain_config_space', return_value=self.config_space), \
+                mock.patch.object(openml.evaluations, 'list_evaluations', self._list_evaluations), \
+                mock.patch('openmlcontrib.setups.obtain_setups_by_ids', self._obtain_setups, create=True), \
+                mock.patch('openmlcontrib.setups.setup_in_config_space', self._in_config_space, create=True):
+            return stream_runhistory_to_file(runhistory_path, 1, 3, 'libsvm_svc', batch_size=10, n_workers=2, **kwargs)
+
+    def test_stream_equals_in_memory(self):
+        from openmlpimp.utils.connect import _evaluations_to_runhistory, _ParameterIndex
+        path = os.path.join(tempfile.mkdtemp(), 'runhistory.json')
+        num_records, num_setups = self._stream(path)
+        self.assertEqual((num_records, num_setups), (19, 6))
+
+        param_index = _ParameterIndex('parameter_name', self.config_space._hyperparameters.keys(), None, None)
+        with mock.patch('openmlcontrib.setups.setup_in_config_space', self._in_config_space, create=True):
+            expected = _evaluations_to_runhistory(self.evaluations, self.setups, 3, self.config_space, param_index)
+        with open(path) as fp:
+            self.assertEqual(json.load(fp), json.loads(json.dumps(expected)))
+
+    def test_no_applicable_setups(self):
+        for setup in self.setups.values():
+            setup.parameters[1].value = 1000.0
+        path = os.path.join(tempfile.mkdtemp(), 'runhistory.json')
+        self.assertEqual(self._stream(path), (0, 0))
+        with open(path) as fp:
+            self.assertEqual(json.load(fp), {'data': [], 'configs': {}})
+
+    def test_not_enough_setups(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'runhistory.json')
+        with self.assertRaises(ValueError):
+            self._stream(path, required_setups=7)
+        # the atomic write is aborted: no (partial or temporary) file
+        self.assertEqual(os.listdir(directory), [])
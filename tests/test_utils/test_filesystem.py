@@ -0,0 +1,22 @@
+import openmlpimp
+import os
+import stat
+import tempfile
+import unittest
+
+
+class AtomicWriteTest(unittest.TestCase):
+
+    def test_permissions(self):
+        directory = tempfile.mkdtemp()
+        with open(os.path.join(directory, 'plain.txt'), 'w') as fp:
+            fp.write('plain')
+        with openmlpimp.utils.atomic_write(os.path.join(directory, 'atomic.txt')) as fp:
+            fp.write('atomic')
+
+        modes = [stat.S_IMODE(os.stat(os.path.join(directory, name)).st_mode) for name in ['plain.txt', 'atomic.txt']]
+        self.assertEqual(modes[1], modes[0])
+        with open(os.path.join(directory, 'atomic.txt')) as fp:
+            self.assertEqual(fp.read(), 'atomic')
+        # no temporary files left behind
+        self.assertEqual(sorted(os.listdir(directory)), ['atomic.txt', 'plain.txt'])
@@ -0,0 +1,83 @@
+import openmlpimp
+import os
+import tempfile
+import unittest
+
+
+class ArtifactManifestTest(unittest.TestCase):
+
+    def _artifact(self, directory, name, size):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as fp:
+            fp.write('x' * size)
+        return path
+
+    def test_lookup_register(self):
+        directory = tempfile.mkdtemp()
+        manifest = openmlpimp.utils.ArtifactManifest(os.path.join(directory, 'manifest.json'))
+        key = openmlpimp.utils.artifact_key('runhistory', 6969, 3, {'kernel': 'rbf'}, {'verbose', 'random_state'})
+        self.assertIsNone(manifest.lookup(key))
+
+        path = self._artifact(directory, 'runhistory.json', 10)
+        manifest.register(key, [path])
+        self.assertEqual(manifest.lookup(key), [path])
+        self.assertEqual(manifest.total_size(), 10)
+
+        # ignore parameters in a different order map to the same artifact
+        same_key = openmlpimp.utils.artifact_key('runhistory', 6969, 3, {'kernel': 'rbf'}, ['random_state', 'verbose'])
+        self.assertEqual(key, same_key)
+
+    def test_eviction(self):
+        directory = tempfile.mkdtemp()
+        manifest = openmlpimp.utils.ArtifactManifest(os.path.join(directory, 'manifest.json'), quota_bytes=25)
+        paths = [self._artifact(directory, 'task%d.json' % idx, 10) for idx in range(3)]
+
+        manifest.register('task0', [paths[0]])
+        manifest.register('task1', [paths[1]])
+        manifest.lookup('task0')
+        evicted = manifest.register('task2', [paths[2]])
+
+        self.assertEqual(evicted, ['task1'])
+        self.assertFalse(os.path.isfile(paths[1]))
+        self.assertIsNotNone(manifest.lookup('task0'))
+        self.assertIsNotNone(manifest.lookup('task2'))
+
+    def test_eviction_protect(self):
+        directory = tempfile.mkdtemp()
+        manifest = openmlpimp.utils.ArtifactManifest(os.path.join(directory, 'manifest.json'), quota_bytes=25)
+        paths = [self._artifact(directory, 'task%d.json' % idx, 10) for idx in range(3)]
+
+        manifest.register('task0', [paths[0]])
+        manifest.register('task1', [paths[1]])
+        evicted = manifest.register('task2', [paths[2]], protect=['task0', 'task1'])
+
+        self.assertEqual(evicted, [])
+        self.assertTrue(all(os.path.isfile(path) for path in paths))
+
+    def test_lookup_deleted_files(self):
+        directory = tempfile.mkdtemp()
+        manifest = openmlpimp.utils.ArtifactManifest(os.path.join(directory, 'manifest.json'))
+        paths = [self._artifact(directory, 'runhistory.json', 10), self._artifact(directory, 'config_space.pcs', 5)]
+        manifest.register('task0', paths)
+
+        os.remove(paths[0])
+        self.assertIsNone(manifest.lookup('task0'))
+        # the remainder of the artifact is removed as well
+        self.assertFalse(os.path.isfile(paths[1]))
+        self.assertIsNone(openmlpimp.utils.ArtifactManifest(manifest.path).lookup('task0'))
+
+    def test_lookup_read_only(self):
+        directory = tempfile.mkdtemp()
+        manifest = openmlpimp.utils.ArtifactManifest(os.path.join(directory, 'manifest.json'))
+        manifest.register('task0', [self._artifact(directory, 'task0.json', 10)])
+        with open(manifest.path) as fp:
+            before = fp.read()
+
+        for _ in range(10):
+            self.assertIsNotNone(manifest.lookup('task0'))
+        with open(manifest.path) as fp:
+            self.assertEqual(fp.read(), before)
+
+        manifest.flush()
+        with open(manifest.path) as fp:
+            self.assertNotEqual(fp.read(), before)
@@ -0,0 +1,48 @@
+import json
+import os
+import tempfile
+import unittest
+
+from openmlpimp.utils.metadataset import _scan_existing
+
+
+class MetaDatasetTest(unittest.TestCase):
+
+    def test_resume_drops_last_task(self):
+        meta_data = {'flow_id': 6970, 'col_parameters': ['algorithm', 'n_estimators']}
+        header = '%% %s\n@RELATION openml-meta-flow-6970\n\n@DATA\n\n' % json.dumps(meta_data)
+        rows = 'SAMME,50,0.9,3\nSAMME.R,60,0.8,3\nSAMME,70,0.7,6\nSAMME,80,0.6,11\nSAMME.R,9'
+
+        path = os.path.join(tempfile.mkdtemp(), 'meta.arff')
+        with open(path, 'w') as fp:
+            fp.write(header + rows)
+
+        completed = _scan_existing(path, meta_data)
+        self.assertEqual(completed, {3, 6})
+        with open(path) as fp:
+            self.assertEqual(fp.read(), header + 'SAMME,50,0.9,3\nSAMME.R,60,0.8,3\nSAMME,70,0.7,6\n')
+
+    def test_other_parameters(self):
+        path = os.path.join(tempfile.mkdtemp(), 'meta.arff')
+        with open(path, 'w') as fp:
+            fp.write('%% %s\n@DATA\n' % json.dumps({'col_parameters': ['algorithm']}))
+        with self.assertRaises(ValueError):
+            _scan_existing(path, {'col_parameters': ['algorithm', 'n_estimators']})
+
+    def test_resume_from_sidecar(self):
+        meta_data = {'flow_id': 6970, 'col_parameters': ['algorithm', 'n_estimators']}
+        header = '%% %s\n@RELATION openml-meta-flow-6970\n\n@DATA\n\n' % json.dumps(meta_data)
+        rows = 'SAMME,50,0.9,3\nSAMME.R,60,0.8,3\nSAMME,70,0.7,6\n'
+
+        path = os.path.join(tempfile.mkdtemp(), 'meta.arff')
+        with open(path, 'w') as fp:
+            # task 11 has no applicable rows; task 12 was interrupted
+            fp.write(header + rows + 'SAMME,80,0.6,12\nSAMME.R,9')
+        with open(path + '.tasks.json', 'w') as fp:
+            json.dump({'tasks': [3, 6, 11], 'size': len(header + rows)}, fp)
+
+        completed = _scan_existing(path, meta_data)
+        # the last task (6) and the empty task (11) are kept
+        self.assertEqual(completed, {3, 6, 11})
+        with open(path) as fp:
+            self.assertEqual(fp.read(), header + rows)
@@ -0,0 +1,52 @@
+import openmlpimp
+import tempfile
+import types
+import unittest
+
+
+class RecordReplayTest(unittest.TestCase):
+
+    def test_record_replay(self):
+        directory = tempfile.mkdtemp()
+        listing = openmlpimp.utils.SyntheticRunListing(25, task_ids=[3, 6, 11, 12])
+        module = types.SimpleNamespace(list_runs=listing)
+        targets = [(module, 'list_runs')]
+
+        with openmlpimp.utils.record(directory, targets=targets):
+            recorded = openmlpimp.utils.task_counts(1, batch_size=10, listing_fn=module.list_runs)
+        self.assertIs(module.list_runs, listing)
+        num_calls = listing.num_calls
+
+        with openmlpimp.utils.replay(directory, targets=targets):
+            replayed = openmlpimp.utils.task_counts(1, batch_size=10, listing_fn=module.list_runs)
+            # not recorded
+            with self.assertRaises(ValueError):
+                module.list_runs(size=5, offset=0)
+        self.assertEqual(recorded, replayed)
+        self.assertEqual(listing.num_calls, num_calls)
+
+    def test_record_replay_method(self):
+        class Task(object):
+            num_calls = 0
+
+            def __init__(self, task_id):
+                self.task_id = task_id
+
+            def download_split(self, repeat=0):
+                Task.num_calls += 1
+                return {'task_id': self.task_id, 'repeat': repeat}
+
+        directory = tempfile.mkdtemp()
+        original = Task.download_split
+        targets = [(Task, 'download_split', 'task_id')]
+        with openmlpimp.utils.record(directory, targets=targets):
+            recorded = [Task(3).download_split(), Task(6).download_split(repeat=1)]
+        self.assertIs(Task.download_split, original)
+
+        with openmlpimp.utils.replay(directory, targets=targets):
+            # other instances, identified by their task id
+            replayed = [Task(3).download_split(), Task(6).download_split(repeat=1)]
+            with self.assertRaises(ValueError):
+                Task(11).download_split()
+        self.assertEqual(recorded, replayed)
+        self.assertEqual(Task.num_calls, 2)
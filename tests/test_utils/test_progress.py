@@ -0,0 +1,23 @@
+import openmlpimp
+import os
+import tempfile
+import unittest
+
+
+class StudyProgressTest(unittest.TestCase):
+
+    def test_resume(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'progress.json')
+        settings = {'flow_id': 6969, 'n_trees': 16, 'fixed_parameters': {'kernel': 'rbf'}}
+        progress = openmlpimp.utils.StudyProgress(path, settings=settings)
+        progress.mark_completed(3, os.path.join(directory, '3', 'pimp_values_fanova.json'))
+        progress.mark_failed(6, 'ValueError()')
+
+        resumed = openmlpimp.utils.StudyProgress(path, settings=settings)
+        self.assertEqual(list(resumed.completed().keys()), [3])
+        self.assertTrue(resumed.is_completed(3))
+        self.assertFalse(resumed.is_completed(6))
+
+        with self.assertRaises(ValueError):
+            openmlpimp.utils.StudyProgress(path, settings={'flow_id': 6969, 'n_trees': 128})